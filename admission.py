@@ -0,0 +1,147 @@
+"""
+Контроль допуска видео в обработку
+
+Два ведра токенов: на пользователя и общее на бота. Стоимость видео
+оценивается по размеру файла и длительности, которые Telegram сообщает
+вместе с обновлением. Если токенов не хватает, пользователь сразу получает
+ответ «занято, попробуйте позже», а скачивание и ffmpeg не запускаются.
+
+Обработчик перед основными только проверяет вёдра и ничего не списывает.
+Списывает бот (charge), когда работа действительно начинается: после
+проверок размера и длительности или при выборе качества. Видео, которые
+отклонены или так и не получили нажатия кнопки, допуск не расходуют.
+"""
+
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from telegram.ext import ApplicationHandlerStop, MessageHandler, filters
+
+from config import (
+    MAX_FILE_SIZE_MB, ADMISSION_USER_RATE, ADMISSION_USER_BURST,
+    ADMISSION_GLOBAL_RATE, ADMISSION_GLOBAL_BURST, ADMISSION_MAX_USERS, MESSAGES
+)
+from duration_limit import CLIP_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate            # Токенов в секунду
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        # Ведро могло появиться позже, чем вызывающий взял now
+        if now <= self.updated:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost, now):
+        """Через сколько секунд в ведре наберётся cost токенов"""
+        self._refill(now)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost):
+        self.tokens -= cost
+
+
+def estimate_cost(media):
+    """Стоимость видео: 1 за задачу плюс до 1 за длительность и до 1 за размер"""
+    duration = getattr(media, 'duration', None) or CLIP_LIMIT
+    file_size = getattr(media, 'file_size', None) or 0
+    return (
+        1.0
+        + min(duration, CLIP_LIMIT) / CLIP_LIMIT
+        + min(file_size / (MAX_FILE_SIZE_MB * 1024 * 1024), 1.0)
+    )
+
+
+class AdmissionController:
+    def __init__(self, user_rate=ADMISSION_USER_RATE, user_burst=ADMISSION_USER_BURST,
+                 global_rate=ADMISSION_GLOBAL_RATE, global_burst=ADMISSION_GLOBAL_BURST,
+                 max_users=ADMISSION_MAX_USERS):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_users = max_users
+        self._global = TokenBucket(global_rate, global_burst)
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _user_bucket(self, user_id):
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst)
+            # Вытесняем давно неактивных пользователей: их вёдра и так полны
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return bucket
+
+    def wait_time(self, user_id, cost):
+        """Сколько секунд подождать, чтобы видео допустили; ничего не списывает"""
+        now = time.monotonic()
+        with self._lock:
+            user = self._user_bucket(user_id)
+            return max(user.wait_time(cost, now), self._global.wait_time(cost, now))
+
+    def admit(self, user_id, cost):
+        """Списывает стоимость, если хватает токенов.
+
+        Возвращает 0, если видео допущено, иначе сколько секунд подождать.
+        Токены списываются только когда хватает обоих вёдер.
+        """
+        now = time.monotonic()
+        with self._lock:
+            user = self._user_bucket(user_id)
+            wait = max(user.wait_time(cost, now), self._global.wait_time(cost, now))
+            if wait > 0:
+                return wait
+            user.take(cost)
+            self._global.take(cost)
+            return 0.0
+
+    async def _reject(self, user_id, cost, wait, reply):
+        logger.info(f"Видео пользователя {user_id} (стоимость {cost:.1f}) отклонено, "
+                    f"повтор через {wait:.0f} сек")
+        await reply(MESSAGES['busy'].format(retry=math.ceil(wait)))
+
+    async def charge(self, user_id, cost, reply):
+        """Списывает стоимость начатой работы; при нехватке токенов отвечает
+        через reply(text) и возвращает False"""
+        wait = self.admit(user_id, cost)
+        if wait > 0:
+            await self._reject(user_id, cost, wait, reply)
+            return False
+        return True
+
+    async def check_update(self, update, context):
+        """Обработчик группы -1: отсекает видео, которые сейчас точно не допустят"""
+        message = update.effective_message
+        media = message.video or message.document
+        user_id = update.effective_user.id if update.effective_user else message.chat_id
+
+        cost = estimate_cost(media)
+        wait = self.wait_time(user_id, cost)
+        if wait > 0:
+            await self._reject(user_id, cost, wait, message.reply_text)
+            raise ApplicationHandlerStop
+
+
+def install_admission(application, controller=None):
+    """Ставит контроль допуска перед обработчиками видео приложения"""
+    controller = controller or AdmissionController()
+    application.add_handler(
+        MessageHandler(filters.VIDEO | filters.Document.VIDEO, controller.check_update),
+        group=-1
+    )
+    return controller
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Офлайн-бенчмарк профилей обработки видеокружков
+
+Создаёт синтетические ролики (ffmpeg testsrc2 + sine) разных разрешений,
+пропорций, длительностей и кодеков, прогоняет через них профили
+circle_engine с разными пресетами x264 и уровни качества точек входа
+(QUALITY_SETTINGS) и записывает в JSON для каждого прогона:
+
+  wall_seconds   - время процесса обработки целиком
+  encode_seconds - время построения графа и работы ffmpeg
+  cpu_seconds    - процессорное время (user + system) процесса и его ffmpeg
+  max_rss_kb     - пиковая память самого «тяжёлого» из этих процессов
+  size_bytes     - объём результата
+  ssim, vmaf     - качество относительно исходника, обрезанного и
+                   масштабированного так же (с той же маской, если она есть);
+                   vmaf - только если ffmpeg собран с libvmaf
+
+Каждый прогон выполняется отдельным процессом, поэтому rusage из os.wait4
+относится только к нему. Уровни качества с 'budget' кодируются своим
+пресетом, без планировщика кодера.
+
+Примеры:
+  python benchmark.py                                  # базовый набор
+  python benchmark.py --full --output full.json        # все ролики
+  python benchmark.py --profiles fast,hq --presets ultrafast,medium
+  python benchmark.py --compare old.json               # сравнить с прошлым запуском
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from config import TEMP_DIR
+from duration_limit import CLIP_LIMIT
+
+BENCH_DIR = os.path.join(TEMP_DIR, 'bench')
+
+# Пропорции и разрешения исходников
+SHAPES = {
+    'landscape': (1280, 720),
+    'portrait': (720, 1280),
+    'square': (720, 720),
+    'classic': (640, 480),
+    'fullhd': (1920, 1080)
+}
+
+# Кодек исходника: контейнер, параметры видео и аудио (None - без звука)
+CODECS = {
+    'h264': ('mp4', ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18', '-pix_fmt', 'yuv420p'],
+             ['-c:a', 'aac', '-b:a', '128k']),
+    'h264-silent': ('mp4', ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18', '-pix_fmt', 'yuv420p'],
+                    None),
+    'hevc': ('mp4', ['-c:v', 'libx265', '-preset', 'veryfast', '-crf', '20', '-pix_fmt', 'yuv420p',
+                     '-tag:v', 'hvc1'],
+             ['-c:a', 'aac', '-b:a', '128k']),
+    'vp9': ('webm', ['-c:v', 'libvpx-vp9', '-deadline', 'realtime', '-cpu-used', '8',
+                     '-b:v', '0', '-crf', '32'],
+            ['-c:a', 'libopus']),
+    'mpeg4': ('avi', ['-c:v', 'mpeg4', '-q:v', '3'], ['-c:a', 'mp2'])
+}
+
+# Базовый набор быстрый; --full включает всё
+DEFAULT_MATRIX = {
+    'shapes': ('landscape', 'portrait', 'square'),
+    'durations': (5, 15),
+    'codecs': ('h264',)
+}
+FULL_MATRIX = {
+    'shapes': tuple(SHAPES),
+    'durations': (5, 15, 60),
+    'codecs': tuple(CODECS)
+}
+
+DEFAULT_PRESETS = ('ultrafast', 'veryfast', 'fast', 'medium')
+DEFAULT_TIER_MODULES = ('bot_final',)
+
+
+def run_command(cmd):
+    """Запускает ffmpeg; stderr нужен для разбора SSIM"""
+    return subprocess.run(cmd, capture_output=True, text=True)
+
+
+def _listed_names(option):
+    """Имена из списка ffmpeg -encoders/-filters (второй столбец)"""
+    output = run_command(['ffmpeg', '-hide_banner', option]).stdout
+    return {line.split()[1] for line in output.splitlines() if len(line.split()) > 1}
+
+
+def available_encoders():
+    """Имена кодировщиков, с которыми собран ffmpeg"""
+    return _listed_names('-encoders')
+
+
+def has_filter(name):
+    return name in _listed_names('-filters')
+
+
+def ffmpeg_version():
+    output = run_command(['ffmpeg', '-hide_banner', '-version']).stdout
+    return output.splitlines()[0] if output else None
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def generate_clip(shape, duration, codec, clip_dir=BENCH_DIR):
+    """Создаёт синтетический ролик (или берёт уже созданный); путь к файлу"""
+    width, height = SHAPES[shape]
+    container, video_args, audio_args = CODECS[codec]
+    path = os.path.join(clip_dir, f'{shape}_{width}x{height}_{duration}s_{codec}.{container}')
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(clip_dir, exist_ok=True)
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate=30:duration={duration}'
+    ]
+    if audio_args is not None:
+        cmd += ['-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={duration}']
+    cmd += video_args + (audio_args or []) + ['-shortest', path + '.tmp.' + container]
+
+    process = run_command(cmd)
+    if process.returncode:
+        raise RuntimeError(f"Не удалось создать {path}: {process.stderr.strip()}")
+    os.replace(path + '.tmp.' + container, path)
+    return path
+
+
+def build_clips(matrix, encoders):
+    clips = []
+    for codec in matrix['codecs']:
+        encoder = CODECS[codec][1][1]
+        if encoder not in encoders:
+            print(f"⚠️ Кодек {codec} пропущен: ffmpeg собран без {encoder}")
+            continue
+        for shape in matrix['shapes']:
+            for duration in matrix['durations']:
+                width, height = SHAPES[shape]
+                clips.append({
+                    'name': f'{shape}-{duration}s-{codec}',
+                    'path': generate_clip(shape, duration, codec),
+                    'width': width,
+                    'height': height,
+                    'duration': duration,
+                    'codec': codec
+                })
+    return clips
+
+
+def build_variants(profiles, presets, tier_modules):
+    """Варианты обработки: профиль × пресет и уровни качества точек входа"""
+    from circle_engine import PROFILES
+
+    variants = []
+    for profile in profiles:
+        for preset in presets:
+            variants.append({
+                'name': f'{profile}/{preset}',
+                'profile': profile,
+                'settings': {**PROFILES[profile]['settings'], 'preset': preset}
+            })
+
+    for module_name in tier_modules:
+        # Точка входа сама знает свой профиль и общие настройки уровней
+        module = __import__(module_name)
+        bot = module.create_bot()
+        for quality, settings in bot.tiers.items():
+            variants.append({
+                'name': f'{module_name}/{quality}',
+                'profile': bot.engine.profile_name,
+                'settings': settings
+            })
+    return variants
+
+
+def run_variant(clip, variant, work_dir):
+    """Прогон одного варианта в отдельном процессе; rusage из os.wait4"""
+    output_path = os.path.join(work_dir, 'output.mp4')
+    stats_path = os.path.join(work_dir, 'stats.json')
+    spec_path = os.path.join(work_dir, 'spec.json')
+    with open(spec_path, 'w') as f:
+        json.dump({
+            'profile': variant['profile'],
+            'settings': variant['settings'],
+            'input': clip['path'],
+            'output': output_path,
+            'stats': stats_path
+        }, f)
+
+    # CIRCLE_PROFILE не должен подменить профиль варианта
+    env = {**os.environ, 'CIRCLE_PROFILE': ''}
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--run-one', spec_path],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    # Читаем stderr до завершения, чтобы процесс не заблокировался на записи
+    stderr = process.stderr.read().decode(errors='replace')
+    process.stderr.close()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.monotonic() - started
+
+    result = {
+        'clip': clip['name'],
+        'variant': variant['name'],
+        'profile': variant['profile'],
+        'preset': variant['settings'].get('preset'),
+        'size': variant['settings']['size'],
+        'ok': False,
+        'wall_seconds': round(wall, 3),
+        'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 3),
+        'max_rss_kb': usage.ru_maxrss
+    }
+    if process.returncode or not os.path.exists(stats_path) or not os.path.exists(output_path):
+        result['error'] = stderr.strip().splitlines()[-1] if stderr.strip() else f'код {process.returncode}'
+        return result
+
+    with open(stats_path) as f:
+        stats = json.load(f)
+    result.update({
+        'ok': True,
+        'encode_seconds': round(stats['encode_seconds'], 3),
+        'stages': {name: round(seconds, 3) for name, seconds in stats['stages'].items()},
+        'size_bytes': os.path.getsize(output_path)
+    })
+    output_duration = min(clip['duration'], CLIP_LIMIT)
+    result['bitrate_kbps'] = round(result['size_bytes'] * 8 / output_duration / 1000, 1)
+    return result
+
+
+def run_one(spec_path):
+    """Выполняется в дочернем процессе: обработка одного ролика одним вариантом"""
+    from circle_engine import CircleEngine, StageTimings, run_frame_profile
+
+    with open(spec_path) as f:
+        spec = json.load(f)
+
+    engine = CircleEngine(spec['profile'])
+    started = time.monotonic()
+    if engine.streaming:
+        timings = StageTimings()
+        graph = engine.build_command(spec['input'], spec['output'], spec['settings'], timings=timings)
+        if graph is None:
+            sys.exit("Не удалось построить граф ffmpeg")
+        with timings.stage('ffmpeg'):
+            graph.run(quiet=True)
+        stages = timings.stages
+    else:
+        stages = run_frame_profile(spec['input'], spec['output'], spec['settings'])
+        if stages is None:
+            sys.exit("Обработка кадров не удалась")
+
+    with open(spec['stats'], 'w') as f:
+        json.dump({'encode_seconds': time.monotonic() - started, 'stages': stages}, f)
+
+
+def reference_filter(clip, size, masked):
+    """Исходник, обрезанный и масштабированный как результат (и с той же маской)"""
+    crop = min(clip['width'], clip['height'])
+    chain = f"[1:v]crop={crop}:{crop},scale={size}:{size}"
+    if masked:
+        return chain + "[ref0];[ref0][2:v]overlay,format=yuv420p[ref]"
+    return chain + ",format=yuv420p[ref]"
+
+
+def measure_quality(clip, result, output_path, masked, vmaf):
+    """SSIM и VMAF результата относительно исходника"""
+    size = result['size']
+    cmd = ['ffmpeg', '-hide_banner', '-i', output_path, '-t', str(CLIP_LIMIT), '-i', clip['path']]
+    if masked:
+        from mask_cache import get_overlay_path
+        cmd += ['-i', get_overlay_path(size)]
+
+    graph = reference_filter(clip, size, masked) + ";[0:v]format=yuv420p[out];"
+    vmaf_log = output_path + '.vmaf.json'
+    if vmaf:
+        # Оба сравнения за один проход: результат и эталон размножаются
+        graph += ("[out]split=2[out1][out2];[ref]split=2[ref1][ref2];"
+                  "[out1][ref1]ssim=shortest=1;"
+                  f"[out2][ref2]libvmaf=log_fmt=json:log_path={vmaf_log}:shortest=1")
+    else:
+        graph += "[out][ref]ssim=shortest=1"
+
+    process = run_command(cmd + ['-filter_complex', graph, '-f', 'null', '-'])
+    if process.returncode:
+        result['quality_error'] = process.stderr.strip().splitlines()[-1] if process.stderr else 'ffmpeg'
+        return
+
+    for line in process.stderr.splitlines():
+        if 'SSIM' in line and 'All:' in line:
+            result['ssim'] = float(line.split('All:')[1].split()[0])
+    if vmaf and os.path.exists(vmaf_log):
+        with open(vmaf_log) as f:
+            result['vmaf'] = round(json.load(f)['pooled_metrics']['vmaf']['mean'], 2)
+
+
+def print_table(results):
+    print(f"{'ролик':<26} {'вариант':<22} {'wall':>6} {'cpu':>6} {'rss,MB':>7} "
+          f"{'KB':>7} {'ssim':>6} {'vmaf':>6}")
+    for r in results:
+        if not r['ok']:
+            print(f"{r['clip']:<26} {r['variant']:<22} ошибка: {r.get('error')}")
+            continue
+        ssim = f"{r['ssim']:.4f}" if 'ssim' in r else '-'
+        vmaf = f"{r['vmaf']:.1f}" if 'vmaf' in r else '-'
+        print(f"{r['clip']:<26} {r['variant']:<22} {r['wall_seconds']:>6.2f} {r['cpu_seconds']:>6.2f} "
+              f"{r['max_rss_kb'] / 1024:>7.1f} {r['size_bytes'] / 1024:>7.0f} {ssim:>6} {vmaf:>6}")
+
+
+def compare(previous_path, results):
+    """Изменения относительно прошлого запуска для совпадающих пар ролик/вариант"""
+    with open(previous_path) as f:
+        previous = json.load(f)
+    old = {(r['clip'], r['variant']): r for r in previous['results'] if r['ok']}
+
+    print(f"\nСравнение с {previous_path} (коммит {previous.get('commit')}):")
+    for r in results:
+        before = old.get((r['clip'], r['variant']))
+        if not r['ok'] or before is None:
+            continue
+        deltas = []
+        for key, label in (('wall_seconds', 'wall'), ('cpu_seconds', 'cpu'),
+                           ('max_rss_kb', 'rss'), ('size_bytes', 'size')):
+            if before.get(key):
+                deltas.append(f"{label} {(r[key] - before[key]) / before[key] * 100:+.1f}%")
+        for key in ('ssim', 'vmaf'):
+            if key in r and key in before:
+                deltas.append(f"{key} {r[key] - before[key]:+.4f}")
+        print(f"{r['clip']:<26} {r['variant']:<22} " + ', '.join(deltas))
+
+
+def split_list(value):
+    return tuple(item for item in value.split(',') if item)
+
+
+def parse_args():
+    from circle_engine import PROFILES
+
+    parser = argparse.ArgumentParser(description="Бенчмарк профилей обработки видеокружков")
+    parser.add_argument('--full', action='store_true', help="все разрешения, длительности и кодеки")
+    parser.add_argument('--shapes', type=split_list, help=f"из {', '.join(SHAPES)}")
+    parser.add_argument('--durations', type=lambda v: tuple(int(d) for d in split_list(v)))
+    parser.add_argument('--codecs', type=split_list, help=f"из {', '.join(CODECS)}")
+    parser.add_argument('--profiles', type=split_list, default=tuple(PROFILES))
+    parser.add_argument('--presets', type=split_list, default=DEFAULT_PRESETS)
+    parser.add_argument('--tiers', type=split_list, default=DEFAULT_TIER_MODULES,
+                        help="точки входа, чьи уровни качества прогнать ('' - не прогонять)")
+    parser.add_argument('--no-quality', action='store_true', help="не считать SSIM/VMAF")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="JSON прошлого запуска")
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.run_one:
+        run_one(args.run_one)
+        return
+
+    if not shutil.which('ffmpeg'):
+        print("❌ ffmpeg не найден")
+        sys.exit(1)
+
+    base = FULL_MATRIX if args.full else DEFAULT_MATRIX
+    matrix = {
+        'shapes': args.shapes or base['shapes'],
+        'durations': args.durations or base['durations'],
+        'codecs': args.codecs or base['codecs']
+    }
+
+    clips = build_clips(matrix, available_encoders())
+    variants = build_variants(args.profiles, args.presets, args.tiers)
+    vmaf = not args.no_quality and has_filter('libvmaf')
+    if not args.no_quality and not vmaf:
+        print("⚠️ ffmpeg собран без libvmaf: считается только SSIM")
+
+    from circle_engine import PROFILES
+    started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    print(f"🔬 {len(clips)} роликов × {len(variants)} вариантов")
+
+    results = []
+    work_dir = os.path.join(BENCH_DIR, 'run')
+    for clip in clips:
+        for variant in variants:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            os.makedirs(work_dir)
+            result = run_variant(clip, variant, work_dir)
+            if result['ok'] and not args.no_quality:
+                masked = 'mask' in PROFILES[variant['profile']]['stages']
+                measure_quality(clip, result, os.path.join(work_dir, 'output.mp4'), masked, vmaf)
+            results.append(result)
+            status = f"{result['wall_seconds']:.2f}s" if result['ok'] else 'ошибка'
+            print(f"  {clip['name']} {variant['name']}: {status}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'commit': git_commit(),
+        'started_at': started_at,
+        'host': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'ffmpeg': ffmpeg_version()
+        },
+        'clips': clips,
+        'variants': variants,
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print()
+    print_table(results)
+    print(f"\n📄 Результаты: {args.output}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,621 @@
+"""
+Общий бот видеокружков
+
+CircleBot делает кружок сразу после получения видео, QualityCircleBot
+сначала предлагает выбрать уровень качества кнопками. Вся обработка идёт
+через circle_engine, поэтому точки входа (bot*.py) задают только профиль,
+настройки, тексты и лимиты, а исправления в обработке действуют для всех.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import functools
+
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+from telegram.ext import CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+
+from config import (
+    MAX_FILE_SIZE_MB, MESSAGES, STREAMING_INGEST, PIPELINED_UPLOAD,
+    STATUS_PROGRESS, STATUS_PROGRESS_STEP, validate_config, setup_temp_directory
+)
+from circle_engine import CircleEngine, StageTimings
+from webhook import build_application, run_bot
+from scratch import scratch_space, output_size_for
+from admission import AdmissionController, install_admission, estimate_cost
+from result_cache import ResultCache, send_cached_video_note
+from pending_store import create_pending_store
+from video_metadata import metadata_cache
+from streaming_ingest import StreamingIngest
+from encoder_planner import encoder_planner
+from job_queue import create_broker
+from video_upload import send_video_note_file, upload_video_note
+from pipelined_upload import StreamTee, StreamAborted
+from pipeline import build_faststart_remux
+from duration_limit import check_duration, CLIP_LIMIT
+from metrics import STAGE_SECONDS, JOB_CPU_SECONDS, HANDLER_SECONDS
+from status_updates import StatusMessage
+import mask_cache
+
+logger = logging.getLogger(__name__)
+
+# Тексты по умолчанию; {name} в статусах заменяется названием уровня качества
+DEFAULT_TEXTS = {
+    'welcome': MESSAGES['welcome'],
+    'help': MESSAGES['help'],
+    'send_video': MESSAGES['send_video'],
+    'processing': MESSAGES['processing'],
+    'queued': MESSAGES['queued'],
+    'creating_circle': MESSAGES['creating_circle'],
+    'sending': MESSAGES['sending'],
+    'done': None,  # None - статусное сообщение удаляется
+    'choose_quality': "🎬 Выберите качество видеокружка:",
+    'error_quality': "❌ Неверное качество.",
+    'error_not_found': "❌ Видео не найдено. Отправьте видео заново.",
+    'error_no_video': MESSAGES['error_no_video'],
+    'error_file_size': MESSAGES['error_file_size'],
+    'error_processing': MESSAGES['error_processing'],
+    'error_timeout': MESSAGES['error_processing'],
+    'error_general': MESSAGES['error_general']
+}
+
+
+def timed_handler(name):
+    """Учитывает время обработчика обновления в HANDLER_SECONDS"""
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            with HANDLER_SECONDS.time(handler=name):
+                return await handler(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class CircleBot:
+    """Кружок сразу после получения видео, без выбора качества"""
+
+    def __init__(self, profile, pipeline_version, settings=None, texts=None,
+                 max_file_size_mb=MAX_FILE_SIZE_MB, timeout=None):
+        self.engine = CircleEngine(profile)
+        self.settings = self.engine.settings(settings)
+        self.texts = {**DEFAULT_TEXTS, **(texts or {})}
+        self.max_file_size = max_file_size_mb * 1024 * 1024
+        self.timeout = timeout  # Время работы ffmpeg, сек (None - без ограничения)
+        # Результаты другого профиля (CIRCLE_PROFILE) не должны попасть из кэша
+        self.pipeline_version = f'{pipeline_version}:{self.engine.profile_name}'
+        self.scratch = scratch_space  # Временные директории задач
+        self.result_cache = ResultCache()
+        self.admission = AdmissionController()  # Списывает допуск, когда работа начинается
+
+    @property
+    def scheduler(self):
+        return self.engine.scheduler
+
+    def text(self, key, settings=None):
+        """Текст статуса с подставленным названием уровня качества"""
+        text = self.texts[key]
+        if text is None:
+            return None
+        return text.format(name=(settings or self.settings).get('name', ''))
+
+    def job_settings(self, job):
+        """Настройки обработки задачи"""
+        return self.settings
+
+    def circle_sizes(self):
+        return (self.settings['size'],)
+
+    def warm_up(self):
+        """Заранее рисует маски, если профиль накладывает их фильтрами ffmpeg"""
+        if 'mask' in self.engine.profile['stages'] and self.engine.streaming:
+            mask_cache.warm_up(self.circle_sizes())
+
+    async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /start"""
+        await update.message.reply_text(self.texts['welcome'])
+
+    async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /help"""
+        await update.message.reply_text(self.texts['help'])
+
+    async def handle_other_messages(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик других типов сообщений"""
+        await update.message.reply_text(self.texts['send_video'])
+
+    @timed_handler('video')
+    async def handle_video(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик видео сообщений"""
+        try:
+            # Отправляем сообщение о начале обработки
+            timings = StageTimings()
+            with timings.stage('status'):
+                processing_msg = await update.message.reply_text(self.text('processing'))
+
+            # Получаем видео файл
+            video = update.message.video or update.message.document
+
+            if not video:
+                await processing_msg.edit_text(self.texts['error_no_video'])
+                return
+
+            # Проверяем размер файла
+            if video.file_size > self.max_file_size:
+                await processing_msg.edit_text(self.texts['error_file_size'])
+                return
+
+            # Слишком длинное видео отсеиваем до скачивания
+            if not await check_duration(video, processing_msg.edit_text):
+                return
+
+            if not await self.admission.charge(
+                update.effective_user.id, estimate_cost(video), processing_msg.edit_text
+            ):
+                return
+
+            job = {
+                'file_id': video.file_id,
+                'file_unique_id': video.file_unique_id,
+                'quality': None,
+                'chat_id': update.effective_chat.id,
+                'reply_to': update.message.message_id,
+                'status_message_id': processing_msg.message_id
+            }
+            status = StatusMessage(
+                context.bot, job['chat_id'], job['status_message_id'], processing_msg.text
+            )
+            try:
+                await self.process_circle_job(context.bot, job, status, timings)
+            finally:
+                await status.close()
+
+        except Exception as e:
+            logger.error(f"Ошибка при обработке видео: {e}")
+            await update.message.reply_text(self.texts['error_general'])
+
+    def plan_encode(self, settings, metadata=None, log=True):
+        """Подбирает настройки кодера для ролика под бюджет уровня качества"""
+        return encoder_planner.plan(
+            settings,
+            duration=metadata.duration if metadata else None,
+            width=metadata.width if metadata else None,
+            height=metadata.height if metadata else None,
+            budget=settings['budget'],
+            queue_depth=self.scheduler.queue_depth,
+            in_flight=self.scheduler.in_flight,
+            log=log
+        )
+
+    def record_encode(self, plan, ingest, elapsed):
+        """Калибрует планировщик; при потоковом чтении время включает скачивание"""
+        if plan is not None and (ingest is None or not ingest.streaming):
+            encoder_planner.record(plan, elapsed)
+
+    async def upload_stream(self, bot, job, tee, settings):
+        """Отправляет кружок из stdout ffmpeg, как только появится первый фрагмент"""
+        await tee.started.wait()
+
+        # Реальная длительность станет известна только после кодирования
+        metadata = metadata_cache.get(job['file_unique_id'])
+        duration = None
+        if metadata and metadata.duration:
+            duration = max(1, round(min(metadata.duration, CLIP_LIMIT)))
+
+        try:
+            return await upload_video_note(
+                bot, tee.chunks(), job['chat_id'],
+                duration=duration,
+                length=settings['size'],
+                reply_to_message_id=job['reply_to']
+            )
+        finally:
+            # Запрос мог упасть до чтения тела - feed не должен ждать место в очереди
+            tee.close()
+
+    async def finish_stream_upload(self, stream_upload):
+        """Дожидается потоковой загрузки; None, если нужно отправить файл обычным способом.
+
+        Запасной путь - только когда кружок точно не отправлен: поток оборван
+        или Telegram отклонил файл. После таймаута или сетевой ошибки Telegram
+        мог уже принять видео, и повторная отправка дала бы дубль.
+        """
+        try:
+            return await stream_upload
+        except (StreamAborted, BadRequest) as e:
+            logger.warning(f"Потоковая отправка не удалась, отправляю файл: {e}")
+            return None
+
+    def output_reservation(self, job, settings):
+        """Место под выход задачи: по maxrate уровня на длительность клипа"""
+        metadata = metadata_cache.get(job['file_unique_id'])
+        duration = CLIP_LIMIT
+        if metadata and metadata.duration:
+            duration = min(metadata.duration, CLIP_LIMIT)
+        # При потоковой отправке может понадобиться копия с faststart
+        copies = 2 if PIPELINED_UPLOAD and self.engine.streaming else 1
+        return output_size_for(settings, duration, copies)
+
+    def record_job_metrics(self, job, timings, result):
+        """Времена этапов задачи и процессорное время ffmpeg - в гистограммы уровня качества"""
+        quality = job['quality'] or self.engine.profile_name
+        if result:
+            # Этапы движка: построение графа, очередь и ffmpeg
+            timings.stages.update(result.stages)
+            JOB_CPU_SECONDS.observe(result.cpu_time, quality=quality)
+        for stage, seconds in timings.stages.items():
+            STAGE_SECONDS.observe(seconds, quality=quality, stage=stage)
+
+    def progress_reporter(self, status, job, settings):
+        """on_progress для транскодирования: процент готовности в статусном сообщении"""
+        metadata = metadata_cache.get(job['file_unique_id'])
+        if not STATUS_PROGRESS or not metadata or not metadata.duration:
+            return None
+
+        duration = min(metadata.duration, CLIP_LIMIT)
+        creating = self.text('creating_circle', settings)
+        last_percent = [0]
+
+        def on_progress(seconds):
+            # 100% покажет уже «Отправляю»
+            percent = min(99, int(seconds / duration * 100))
+            if percent - last_percent[0] >= STATUS_PROGRESS_STEP:
+                last_percent[0] = percent
+                status.update(f"{creating} {percent}%")
+
+        return on_progress
+
+    async def process_circle_job(self, bot, job, status, timings=None):
+        """Обрабатывает видео и отправляет кружок; status - StatusMessage задачи.
+
+        Вызывается обработчиками бота и воркером распределённой очереди.
+        Статусы не ждут Telegram: их отправляет status в фоне, закрывает
+        его вызывающий. timings - уже замеренные обработчиком этапы.
+        Возвращает True, если кружок отправлен.
+        """
+        timings = timings or StageTimings()
+        started = time.monotonic()
+        settings = None
+        result = None
+        try:
+            settings = self.job_settings(job)
+            cache_key = job['quality'] or str(settings['size'])
+
+            # Этот ролик уже обрабатывался в таком качестве - отправляем готовый кружок
+            with timings.stage('cache'):
+                cached = await send_cached_video_note(
+                    bot, self.result_cache,
+                    job['file_unique_id'], cache_key, self.pipeline_version,
+                    chat_id=job['chat_id'],
+                    length=settings['size'],
+                    reply_to_message_id=job['reply_to']
+                )
+            if cached:
+                status.update(self.text('done', settings))
+                return True
+
+            # Статус обработки
+            status.update(self.text('processing', settings))
+
+            # Скачиваем файл
+            with timings.stage('get_file'):
+                file = await bot.get_file(job['file_id'])
+
+            # Директория задачи удаляется при любом исходе; место под файлы
+            # резервируется до скачивания
+            scratch_started = time.monotonic()
+            output_size = self.output_reservation(job, settings)
+            async with self.scratch.job(file.file_size, output_size) as job_dir:
+                timings.add('scratch', time.monotonic() - scratch_started)
+                input_path = job_dir.file('input.mp4')
+                output_path = job_dir.file('output.mp4')
+
+                # Настройки кодера под длительность, разрешение и загрузку очереди
+                plan = None
+                if settings.get('budget'):
+                    plan = self.plan_encode(settings, metadata_cache.get(job['file_unique_id']))
+
+                if STREAMING_INGEST and self.engine.streaming:
+                    # Скачивание идёт прямо в ffmpeg; input_path нужен, только если
+                    # контейнер требует перемотки
+                    ingest = StreamingIngest(file, input_path)
+                else:
+                    # Скачиваем
+                    with timings.stage('download'):
+                        await file.download_to_drive(input_path)
+                    ingest = None
+
+                status.update(self.text('creating_circle', settings))
+
+                stream_upload = None
+                tee = None
+                if PIPELINED_UPLOAD and self.engine.streaming:
+                    # ffmpeg пишет фрагменты в stdout, загрузка идёт параллельно с кодированием
+                    tee = StreamTee(output_path)
+                    stream_upload = asyncio.create_task(self.upload_stream(bot, job, tee, settings))
+
+                try:
+                    result = await self.engine.transcode(
+                        input_path, output_path, settings,
+                        plan=plan,
+                        file_unique_id=job['file_unique_id'],
+                        timeout=settings.get('timeout', self.timeout),
+                        ingest=ingest,
+                        stdout_sink=tee.feed if tee else None,
+                        on_queued=lambda position: status(
+                            self.texts['queued'].format(position=position)
+                        ),
+                        on_progress=self.progress_reporter(status, job, settings)
+                    )
+                except asyncio.TimeoutError:
+                    logger.error("Таймаут при обработке видео")
+                    if stream_upload is not None:
+                        stream_upload.cancel()
+                    status.update(self.text('error_timeout', settings))
+                    return False
+
+                if not result and stream_upload is not None:
+                    stream_upload.cancel()
+
+                if result:
+                    sent = None
+                    if stream_upload is not None:
+                        # Загрузка шла вместе с ffmpeg - здесь только её окончание
+                        with timings.stage('upload'):
+                            sent = await self.finish_stream_upload(stream_upload)
+                        if sent is None:
+                            # Telegram не принял поток - перепаковываем в обычный MP4 с faststart
+                            faststart_path = output_path + '.faststart.mp4'
+                            with timings.stage('remux'):
+                                remuxed = await self.scheduler.submit(
+                                    build_faststart_remux, output_path, faststart_path,
+                                    output_path=faststart_path,
+                                    timeout=30
+                                )
+                            if remuxed:
+                                os.replace(faststart_path, output_path)
+                                result.duration = remuxed.duration
+                    else:
+                        # Время кодирования без влияния загрузки - для калибровки планировщика
+                        self.record_encode(plan, ingest, result.encode_time)
+
+                    if sent is None:
+                        status.update(self.text('sending', settings))
+
+                        # Отправляем видеокружок
+                        with timings.stage('upload'):
+                            sent = await send_video_note_file(
+                                bot, output_path,
+                                chat_id=job['chat_id'],
+                                **result.send_kwargs(),  # Реальные длительность и диаметр файла
+                                reply_to_message_id=job['reply_to']
+                            )
+
+                    await self.result_cache.put(
+                        job['file_unique_id'], cache_key, self.pipeline_version,
+                        sent.video_note.file_id if sent.video_note else None
+                    )
+
+                    status.update(self.text('done', settings))
+                else:
+                    status.update(self.text('error_processing', settings))
+
+            return bool(result)
+
+        except Exception as e:
+            logger.error(f"Ошибка обработки видео: {e}")
+            status.update(self.text('error_general', settings))
+            return False
+        finally:
+            timings.add('total', time.monotonic() - started)
+            self.record_job_metrics(job, timings, result)
+
+    def register(self, application):
+        """Добавляет обработчики бота в приложение"""
+        application.add_handler(CommandHandler("start", self.start))
+        application.add_handler(CommandHandler("help", self.help_command))
+
+        # Обработчик видео
+        application.add_handler(MessageHandler(
+            filters.VIDEO | (filters.Document.VIDEO),
+            self.handle_video
+        ))
+
+        # Обработчик остальных сообщений
+        application.add_handler(MessageHandler(
+            filters.TEXT & ~filters.COMMAND,
+            self.handle_other_messages
+        ))
+
+
+class QualityCircleBot(CircleBot):
+    """Кружок с выбором уровня качества кнопками.
+
+    tiers - уровни качества: настройки профиля плюс 'name' и, по желанию,
+    'desc' (подпись кнопки), 'budget' (бюджет кодирования для планировщика,
+    подпись - оценка времени) и 'timeout'.
+    """
+
+    def __init__(self, profile, pipeline_version, tiers, callback_prefix='q_', **kwargs):
+        super().__init__(profile, pipeline_version, **kwargs)
+        # Уровень качества дополняет общие настройки точки входа
+        self.tiers = {key: {**self.settings, **tier} for key, tier in tiers.items()}
+        self.callback_prefix = callback_prefix
+        self.pending_videos = create_pending_store()  # Видео в ожидании выбора качества
+        self.in_flight = set()  # Токены видео, которые сейчас обрабатываются
+        self.job_broker = create_broker()  # None - обработка в этом же процессе
+
+    def job_settings(self, job):
+        return self.tiers[job['quality']]
+
+    def circle_sizes(self):
+        return tuple(sorted({tier['size'] for tier in self.tiers.values()}))
+
+    def button_label(self, settings, metadata):
+        """Подпись кнопки уровня качества"""
+        if settings.get('budget'):
+            # Оценка времени для этого ролика при текущей загрузке
+            plan = self.plan_encode(settings, metadata, log=False)
+            return f"📹 {settings['name']} (~{max(1, round(plan.predicted_seconds))} сек обработки)"
+        if settings.get('desc'):
+            return f"📹 {settings['name']} ({settings['desc']})"
+        return f"📹 {settings['name']}"
+
+    @timed_handler('video')
+    async def handle_video(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик видео сообщений - показывает выбор качества"""
+        try:
+            video = update.message.video or update.message.document
+
+            if not video:
+                await update.message.reply_text(self.texts['error_no_video'])
+                return
+
+            # Проверяем размер файла
+            if video.file_size > self.max_file_size:
+                await update.message.reply_text(self.texts['error_file_size'])
+                return
+
+            # Слишком длинное видео отсеиваем до скачивания
+            if not await check_duration(video, update.message.reply_text):
+                return
+
+            # Сохраняем информацию о видео
+            token = await self.pending_videos.add({
+                'file_id': video.file_id,
+                'file_unique_id': video.file_unique_id,
+                'file_size': video.file_size,
+                'message_id': update.message.message_id,
+                'cost': estimate_cost(video)  # Допуск списывается при выборе качества
+            })
+
+            # Запоминаем размеры и длительность, которые уже сообщил Telegram
+            metadata_cache.prime(video.file_unique_id, video)
+            metadata = metadata_cache.get(video.file_unique_id)
+
+            # Создаем клавиатуру с выбором качества
+            keyboard = [
+                [InlineKeyboardButton(
+                    self.button_label(settings, metadata),
+                    callback_data=f"{self.callback_prefix}{quality_key}:{token}"
+                )]
+                for quality_key, settings in self.tiers.items()
+            ]
+
+            await update.message.reply_text(
+                self.texts['choose_quality'],
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+
+        except Exception as e:
+            logger.error(f"Ошибка при обработке видео: {e}")
+            await update.message.reply_text(self.texts['error_general'])
+
+    @timed_handler('quality_choice')
+    async def handle_quality_choice(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик выбора качества"""
+        try:
+            query = update.callback_query
+            timings = StageTimings()
+            with timings.stage('status'):
+                await query.answer()
+
+            # Получаем качество и токен видео
+            quality, _, token = query.data[len(self.callback_prefix):].partition(':')
+            if quality not in self.tiers:
+                await query.edit_message_text(self.texts['error_quality'])
+                return
+
+            # Повторное нажатие, пока видео обрабатывается, ничего не запускает
+            if token in self.in_flight:
+                return
+
+            # Токен занимается до первого await: нажатия обрабатываются параллельно
+            self.in_flight.add(token)
+            try:
+                video_info = await self.pending_videos.get(token)
+                if video_info is None:
+                    await query.edit_message_text(self.texts['error_not_found'])
+                    return
+
+                # Отказ приходит отдельным сообщением: кнопки остаются для повтора
+                if not await self.admission.charge(
+                    update.effective_user.id, video_info.get('cost', 1.0), query.message.reply_text
+                ):
+                    return
+
+                job = {
+                    'file_id': video_info['file_id'],
+                    'file_unique_id': video_info['file_unique_id'],
+                    'quality': quality,
+                    'chat_id': update.effective_chat.id,
+                    'reply_to': video_info['message_id'],
+                    'status_message_id': query.message.message_id
+                }
+
+                if self.job_broker is not None:
+                    # Раздельный режим: обработку выполнит один из воркеров (worker.py),
+                    # результата фронтенд не узнает - видео забираем сразу
+                    if await self.pending_videos.pop(token) is None:
+                        return
+                    position = await self.job_broker.enqueue(job)
+                    await query.edit_message_text(self.texts['queued'].format(position=position))
+                    return
+
+                status = StatusMessage(
+                    context.bot, job['chat_id'], job['status_message_id'], query.message.text
+                )
+                try:
+                    sent = await self.process_circle_job(context.bot, job, status, timings)
+                finally:
+                    await status.close()
+
+                if sent:
+                    await self.pending_videos.pop(token)
+                elif query.message.reply_markup:
+                    # После таймаута или ошибки можно выбрать качество пониже
+                    await query.edit_message_reply_markup(reply_markup=query.message.reply_markup)
+            finally:
+                self.in_flight.discard(token)
+
+        except Exception as e:
+            logger.error(f"Ошибка выбора качества: {e}")
+            await query.edit_message_text(self.texts['error_general'])
+
+    def register(self, application):
+        super().register(application)
+        application.add_handler(CallbackQueryHandler(
+            self.handle_quality_choice, pattern=f'^{self.callback_prefix}'
+        ))
+
+
+def run_circle_bot(create_bot, banner):
+    """Запуск бота: create_bot() создаёт CircleBot, banner - строки для консоли"""
+    # Проверяем конфигурацию
+    if not validate_config():
+        return
+
+    # Настраиваем директории
+    setup_temp_directory()
+    scratch_space.sweep()
+
+    # Создаем экземпляр бота
+    bot = create_bot()
+    bot.warm_up()
+
+    # Создаем приложение
+    application = build_application()
+
+    # Контроль допуска срабатывает раньше обработчиков видео
+    install_admission(application, bot.admission)
+
+    # Добавляем обработчики
+    bot.register(application)
+
+    # Запускаем бота
+    for line in banner:
+        print(line)
+    print(f"Профиль обработки: {bot.engine.profile_name}")
+    print("Нажмите Ctrl+C для остановки")
+
+    run_bot(application)
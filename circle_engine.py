@@ -0,0 +1,351 @@
+"""
+Единый движок обработки видеокружков
+
+Обработка собирается из этапов (probe, crop, scale, mask, encode, mux),
+набор которых задаётся именованным профилем:
+
+  fast      - квадрат без маски, быстрый пресет (Telegram сам скругляет кружок)
+  hq        - квадрат без маски, высокий профиль H.264 и настраиваемое аудио
+  geq-mask  - маска фильтрами ffmpeg (готовая PNG-рамка через overlay) в одном процессе
+  cv2-mask  - маска кадров OpenCV/NumPy: ffmpeg → маска → ffmpeg в пуле процессов
+
+Этапы графовых профилей строят один граф ffmpeg, который выполняется одним
+процессом через TranscodeScheduler, поэтому отдельно измеряются построение
+каждого этапа, ожидание в очереди и работа ffmpeg. Этапы cv2-mask - отдельные
+процессы, и каждый измеряется целиком. Времена этапов попадают в
+TranscodeResult.stages.
+
+Профиль можно подменить переменной CIRCLE_PROFILE, не меняя точку входа.
+"""
+
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+
+import ffmpeg
+
+from config import VIDEO_CIRCLE_SIZE, VIDEO_CODEC, AUDIO_CODEC, CRF_VALUE, CIRCLE_PROFILE
+from duration_limit import input_limit_args
+from pipeline import apply_circle_mask
+from pipelined_upload import STREAM_OUTPUT, FRAGMENTED_MOVFLAGS
+from streaming_ingest import STREAM_INPUT
+from transcode_pool import TranscodeScheduler
+from transcode_result import inspect_output
+from video_metadata import get_video_metadata
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimings:
+    """Времена этапов одной задачи, сек (в порядке выполнения)"""
+
+    def __init__(self, stages=None):
+        self.stages = dict(stages or {})
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - started)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def __repr__(self):
+        return ' '.join(f"{name}={seconds:.2f}s" for name, seconds in self.stages.items())
+
+
+class CircleGraph:
+    """Состояние графа ffmpeg, которое этапы передают друг другу"""
+
+    def __init__(self, input_path, output_path, settings, plan=None, file_unique_id=None):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.settings = settings
+        self.plan = plan
+        self.file_unique_id = file_unique_id
+        self.input_stream = ffmpeg.input(input_path, **input_limit_args())
+        self.video = self.input_stream.video
+        self.metadata = None  # Без этапа probe размеры и аудио определяет сам ffmpeg
+        self.output_args = {}
+        self.output = None
+
+
+def probe_stage(graph):
+    """Размеры и наличие аудио исходника (поток из канала заранее не прочитать)"""
+    if graph.input_path != STREAM_INPUT:
+        graph.metadata = get_video_metadata(graph.input_path, graph.file_unique_id)
+
+
+def crop_stage(graph):
+    """Центрированный квадрат по меньшей стороне"""
+    if graph.metadata is None:
+        # Значения по умолчанию x/y у crop центрируют квадрат
+        graph.video = graph.video.filter('crop', 'min(iw,ih)', 'min(iw,ih)')
+        return
+
+    width = graph.metadata.width
+    height = graph.metadata.height
+    size = min(width, height)
+    graph.video = graph.video.filter(
+        'crop', size, size, (width - size) // 2, (height - size) // 2
+    )
+
+
+def scale_stage(graph):
+    size = graph.settings['size']
+    graph.video = graph.video.filter('scale', size, size)
+
+
+def mask_stage(graph):
+    """Круглая маска фильтрами ffmpeg: PNG-рамка из кэша масок через overlay"""
+    graph.video = apply_circle_mask(graph.video, graph.settings['size'])
+
+
+def encode_stage(graph):
+    """Параметры видеокодека: из плана кодера, если он есть, иначе из настроек профиля"""
+    settings = graph.settings
+    if graph.plan is not None:
+        args = graph.plan.output_args()
+    else:
+        args = {
+            'vcodec': settings['vcodec'],
+            'preset': settings['preset'],
+            'crf': settings['crf']
+        }
+        if settings.get('bitrate'):
+            rate = int(settings['bitrate'][:-1])
+            args['maxrate'] = settings['bitrate']
+            args['bufsize'] = settings.get('bufsize') or f"{rate * 2}k"
+        if settings.get('threads'):
+            args['threads'] = settings['threads']
+
+    args['pix_fmt'] = 'yuv420p'
+    args['movflags'] = 'faststart'
+    if settings.get('profile'):
+        args['profile:v'] = settings['profile']
+        args['level'] = settings['level']
+
+    if graph.output_path == STREAM_OUTPUT:
+        # В канал пишется фрагментированный MP4: faststart требует перемотки файла
+        args['movflags'] = FRAGMENTED_MOVFLAGS
+        args['f'] = 'mp4'
+
+    graph.output_args.update(args)
+
+
+def mux_stage(graph):
+    """Сборка выхода: видео и аудио (если оно есть)"""
+    settings = graph.settings
+    if graph.metadata is None:
+        # 'a?' - необязательная аудиодорожка: отдельный ffprobe не нужен
+        audio = graph.input_stream['a?']
+    elif graph.metadata.has_audio:
+        audio = graph.input_stream.audio
+    else:
+        audio = None
+
+    streams = [graph.video]
+    if audio is not None:
+        streams.append(audio)
+        graph.output_args['acodec'] = settings['acodec']
+        for key in ('audio_bitrate', 'ar', 'ac'):
+            if settings.get(key):
+                graph.output_args[key] = settings[key]
+
+    graph.output = ffmpeg.output(
+        *streams, graph.output_path, **graph.output_args
+    ).overwrite_output()
+
+
+STAGES = {
+    'probe': probe_stage,
+    'crop': crop_stage,
+    'scale': scale_stage,
+    'mask': mask_stage,
+    'encode': encode_stage,
+    'mux': mux_stage
+}
+
+PROFILES = {
+    'fast': {
+        'stages': ('probe', 'crop', 'scale', 'encode', 'mux'),
+        'settings': {
+            'size': VIDEO_CIRCLE_SIZE,
+            'vcodec': 'libx264',
+            'preset': 'ultrafast',  # Максимальная скорость
+            'crf': 28,              # Более сжатое видео для скорости
+            'threads': 4,
+            'acodec': 'aac'
+        }
+    },
+    'hq': {
+        'stages': ('probe', 'crop', 'scale', 'encode', 'mux'),
+        'settings': {
+            'size': VIDEO_CIRCLE_SIZE,
+            'vcodec': 'libx264',
+            'preset': 'medium',
+            'crf': 18,
+            'profile': 'high',
+            'level': '4.0',
+            'acodec': 'aac',
+            'audio_bitrate': '128k',
+            'ar': 44100,
+            'ac': 2
+        }
+    },
+    'geq-mask': {
+        'stages': ('crop', 'scale', 'mask', 'encode', 'mux'),
+        'settings': {
+            'size': VIDEO_CIRCLE_SIZE,
+            'vcodec': VIDEO_CODEC,
+            'preset': 'fast',
+            'crf': CRF_VALUE,
+            'acodec': AUDIO_CODEC
+        }
+    },
+    'cv2-mask': {
+        # Этапы выполняются отдельными процессами, см. legacy_pipeline
+        'stages': ('square', 'mask', 'mux'),
+        'frames': True,
+        'settings': {
+            'size': VIDEO_CIRCLE_SIZE,
+            'vcodec': VIDEO_CODEC,
+            'preset': 'fast',
+            'crf': CRF_VALUE,
+            'acodec': AUDIO_CODEC
+        }
+    }
+}
+
+
+def run_frame_profile(input_path, output_path, settings):
+    """Профиль cv2-mask в рабочем процессе; времена этапов или None при ошибке"""
+    # OpenCV нужен только этому профилю
+    from legacy_pipeline import process_video_to_circle_legacy
+
+    timings = StageTimings()
+    if not process_video_to_circle_legacy(input_path, output_path, settings['size'], timings,
+                                          crf=settings['crf'], preset=settings['preset']):
+        return None
+    return timings.stages
+
+
+class CircleEngine:
+    def __init__(self, profile, scheduler=None, backend=None):
+        # CIRCLE_PROFILE подменяет профиль точки входа (например, для A/B)
+        self.profile_name = CIRCLE_PROFILE or profile
+        if self.profile_name not in PROFILES:
+            raise ValueError(f"Неизвестный профиль обработки: {self.profile_name}")
+        self.profile = PROFILES[self.profile_name]
+        self.scheduler = scheduler or TranscodeScheduler()
+        self._backend = backend
+
+    @property
+    def streaming(self):
+        """Может ли профиль читать вход из канала и писать выход в канал"""
+        return not self.profile.get('frames')
+
+    @property
+    def backend(self):
+        """Пул процессов для профилей с обработкой кадров в Python (создаётся по требованию)"""
+        if self._backend is None:
+            from process_backend import create_backend
+            self._backend = create_backend()
+        return self._backend
+
+    def settings(self, overrides=None):
+        """Настройки профиля, дополненные настройками точки входа или уровня качества"""
+        return {**self.profile['settings'], **(overrides or {})}
+
+    def build_command(self, input_path, output_path, settings, plan=None, file_unique_id=None,
+                      timings=None):
+        """Строит граф ffmpeg этапами профиля; None, если подготовить не удалось"""
+        timings = timings or StageTimings()
+        try:
+            graph = CircleGraph(input_path, output_path, settings, plan, file_unique_id)
+            for name in self.profile['stages']:
+                with timings.stage(name):
+                    STAGES[name](graph)
+            return graph.output
+
+        except ffmpeg.Error as e:
+            logger.error(f"Ошибка ffmpeg: {e.stderr.decode() if e.stderr else str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка при подготовке команды ffmpeg: {e}")
+            return None
+
+    async def transcode(self, input_path, output_path, settings, plan=None, file_unique_id=None,
+                        timeout=None, on_queued=None, ingest=None, stdout_sink=None,
+                        on_progress=None):
+        """Обрабатывает видео профилем и возвращает TranscodeResult или None.
+
+        output_path - файл результата. Если задан stdout_sink, ffmpeg пишет
+        в канал, а stdout_sink сам сохраняет файл (см. pipelined_upload).
+        При ingest первым аргументом команды станет его вход (см. submit).
+        on_progress получает закодированные секунды (профили с
+        маскированием кадров прогресс не сообщают, а ingest и stdout_sink
+        им не передаются - см. streaming).
+        """
+        if not self.streaming:
+            return await self._transcode_frames(
+                input_path, output_path, settings, timeout=timeout, on_queued=on_queued
+            )
+
+        timings = StageTimings()
+
+        def build(*args):
+            return self.build_command(
+                *args, settings, plan=plan, file_unique_id=file_unique_id, timings=timings
+            )
+
+        target = STREAM_OUTPUT if stdout_sink is not None else output_path
+        args = (target,) if ingest is not None else (input_path, target)
+        result = await self.scheduler.submit(
+            build, *args,
+            output_path=output_path,
+            timeout=timeout,
+            on_queued=on_queued,
+            ingest=ingest,
+            stdout_sink=stdout_sink,
+            on_progress=on_progress
+        )
+        if result:
+            timings.add('queue', result.queue_time)
+            timings.add('ffmpeg', result.encode_time)
+            result.stages = timings.stages
+            logger.info(f"Этапы {self.profile_name}: {timings}")
+        return result
+
+    async def _transcode_frames(self, input_path, output_path, settings, timeout=None,
+                                on_queued=None):
+        """Профиль с маскированием кадров: все этапы в рабочем процессе.
+
+        Задача занимает слот пула перекодирования, как и ffmpeg; по
+        истечении timeout рабочий процесс убивается и выбрасывается
+        asyncio.TimeoutError.
+        """
+        async with self.scheduler.slot(on_queued) as job:
+            started = time.monotonic()
+            stages = await self.backend.run(
+                run_frame_profile, input_path, output_path, settings, timeout=timeout
+            )
+            if not stages:
+                return None
+
+            result = await asyncio.to_thread(
+                inspect_output, output_path, time.monotonic() - started, job.wait_time
+            )
+        if result:
+            result.stages = stages
+            logger.info(f"Этапы {self.profile_name}: {StageTimings(stages)}")
+        return result
+
+    def shutdown(self):
+        self.scheduler.shutdown()
+        if self._backend is not None:
+            self._backend.shutdown()
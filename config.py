@@ -12,6 +12,7 @@ BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 VIDEO_CIRCLE_SIZE = 240  # Размер видеокружка в пикселях
 MAX_FILE_SIZE_MB = 50    # Максимальный размер файла в МБ
 MAX_DURATION_SECONDS = 60  # Максимальная длительность видеокружка в секундах
+LONG_VIDEO_POLICY = os.getenv('LONG_VIDEO_POLICY', 'trim')  # 'trim' - обрезать, 'reject' - отклонить
 
 # Настройки обработки видео
 VIDEO_CODEC = 'libx264'  # Кодек для видео
@@ -22,9 +23,128 @@ AUDIO_BITRATE = '128k'   # Битрейт аудио
 # Качество сжатия (0-51, где 0 - без потерь, 23 - по умолчанию, 51 - максимальное сжатие)
 CRF_VALUE = 23
 
+# Режим конвейера: 'single_pass' - один процесс ffmpeg без промежуточных файлов,
+# 'legacy' - прежняя трёхэтапная обработка через OpenCV/PIL
+CIRCLE_PIPELINE_MODE = os.getenv('CIRCLE_PIPELINE_MODE', 'single_pass')
+
+# Профиль обработки circle_engine ('fast', 'hq', 'geq-mask', 'cv2-mask').
+# Пустое значение - профиль, выбранный точкой входа (bot_*.py)
+CIRCLE_PROFILE = os.getenv('CIRCLE_PROFILE', '')
+
+# Максимум одновременных процессов ffmpeg (libx264 сам использует несколько ядер)
+TRANSCODE_WORKERS = int(os.getenv('TRANSCODE_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+FFMPEG_TERM_GRACE = 3.0  # Секунд ожидания после SIGTERM перед SIGKILL
+FFMPEG_KILL_GRACE = 2.0  # Секунд ожидания после SIGKILL, дальше процесс считается потерянным
+
+# Подбор настроек x264 под ролик и загрузку
+ENCODER_CORES = int(os.getenv('ENCODER_CORES', len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 2)))
+PLANNER_DEFAULT_FPS = 30    # Частота кадров, если она неизвестна
+PLANNER_SMOOTHING = 0.2     # Вес нового замера при калибровке модели
+
+# Обработка кадров в Python (маска OpenCV/NumPy) вне цикла событий:
+# 'process' - пул процессов, 'thread' - пул потоков
+FRAME_BACKEND = os.getenv('FRAME_BACKEND', 'process')
+FRAME_WORKERS = int(os.getenv('FRAME_WORKERS', ENCODER_CORES))
+
+# Потоковая передача скачиваемого видео в ffmpeg без ожидания полной загрузки
+STREAMING_INGEST = os.getenv('STREAMING_INGEST', '1') == '1'
+STREAM_CHUNK_SIZE = 64 * 1024       # Размер порции при скачивании
+STREAM_SNIFF_LIMIT = 1024 * 1024    # Сколько байт читать, чтобы найти атом moov
+
+# Отправка готового кружка потоком, без чтения файла целиком в память
+ZERO_COPY_UPLOAD = os.getenv('ZERO_COPY_UPLOAD', '1') == '1'
+UPLOAD_CHUNK_SIZE = 256 * 1024     # Размер порции при отправке
+
+# Загрузка в Telegram одновременно с кодированием (фрагментированный MP4 из stdout ffmpeg)
+PIPELINED_UPLOAD = os.getenv('PIPELINED_UPLOAD', '0') == '1'
+PIPELINED_UPLOAD_BUFFER = 64       # Порций stdout в очереди между ffmpeg и загрузкой
+
+# Контроль допуска: вёдра токенов на пользователя и на весь бот.
+# Видео стоит от 1 до 3 токенов в зависимости от длительности и размера файла
+ADMISSION_USER_RATE = 6 / 300      # Токенов в секунду на пользователя (6 за 5 минут)
+ADMISSION_USER_BURST = 6           # Запас токенов пользователя
+ADMISSION_GLOBAL_RATE = TRANSCODE_WORKERS * 0.1  # Сколько токенов в секунду успевают воркеры
+ADMISSION_GLOBAL_BURST = 30        # Запас токенов всего бота
+ADMISSION_MAX_USERS = 100000       # Сколько пользователей помнить
+
+# Статусные сообщения: правки отправляются в фоне, устаревшие состояния отбрасываются
+STATUS_CHAT_INTERVAL = 1.0         # Не чаще одной правки в секунду на чат
+STATUS_GLOBAL_RATE = 25            # Правок в секунду на весь бот (лимит Telegram ~30)
+STATUS_GLOBAL_BURST = 30
+STATUS_CLOSE_TIMEOUT = 10.0        # Сколько ждать отправки последнего состояния, сек
+STATUS_PROGRESS = os.getenv('STATUS_PROGRESS', '1') == '1'  # Процент кодирования из ffmpeg -progress
+STATUS_PROGRESS_STEP = 10          # Шаг процента, с которым обновляется статус
+
+# Сколько метаданных видео хранить в памяти (по file_unique_id)
+METADATA_CACHE_SIZE = 1024
+
 # Настройки временных файлов
 TEMP_DIR = '/tmp/video_circle_bot'  # Директория для временных файлов
 CLEANUP_TEMP_FILES = True           # Автоматическая очистка временных файлов
+SCRATCH_DIR = os.path.join(TEMP_DIR, 'jobs')  # Директории задач (вход, выход, промежуточные файлы)
+SCRATCH_QUOTA_MB = int(os.getenv('SCRATCH_QUOTA_MB', '2048'))  # Сколько места могут занять задачи
+SCRATCH_OUTPUT_RESERVE_MB = 32      # Минимальный резерв под выход и промежуточные файлы задачи
+SCRATCH_STALE_SECONDS = 3600        # Директории старше этого удаляются при запуске
+
+# Небольшие задачи целиком в памяти (tmpfs): без записи на диск.
+# Пустая строка в SCRATCH_RAM_DIR отключает режим
+SCRATCH_RAM_DIR = os.getenv('SCRATCH_RAM_DIR', '/dev/shm/video_circle_bot')
+SCRATCH_RAM_QUOTA_MB = int(os.getenv('SCRATCH_RAM_QUOTA_MB', '256'))  # Не больше этого в памяти
+SCRATCH_RAM_MAX_INPUT_MB = 10       # Видео крупнее уходят на диск
+SCRATCH_RAM_OUTPUT_RESERVE_MB = 16  # Резерв под выход, если у уровня нет maxrate
+
+# Настройки круглой маски
+MASK_CACHE_DIR = os.path.join(TEMP_DIR, 'masks')  # Директория с готовыми масками
+MASK_ANTIALIAS = True                             # Сглаживание краёв круга
+MASK_SIZES = (240, 320, 480, 512, 640)            # Размеры, создаваемые при запуске
+FRAME_BATCH_SIZE = 16                             # Кадров в пачке при маскировании NumPy
+
+# Постоянные данные бота (кэш результатов и т.п.)
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+
+# Кэш готовых видеокружков (file_id по file_unique_id исходника и качеству)
+RESULT_CACHE_PATH = os.path.join(DATA_DIR, 'result_cache.sqlite3')
+RESULT_CACHE_MAX_ENTRIES = 50000    # Максимум записей (вытесняются давно неиспользуемые)
+RESULT_CACHE_TTL = 30 * 24 * 3600   # Время жизни записи, сек
+
+# Видео, ожидающие выбора качества
+PENDING_BACKEND = os.getenv('PENDING_BACKEND', 'memory')  # 'memory' или 'sqlite'
+PENDING_STORE_PATH = os.path.join(DATA_DIR, 'pending.sqlite3')
+PENDING_TTL = 3600              # Сколько секунд ждать нажатия кнопки
+PENDING_MAX_ENTRIES = 10000     # Максимум ожидающих видео
+
+# Распределённая очередь задач: 'local' - обработка в процессе бота,
+# 'sqlite' или 'redis' - задачи выполняют отдельные воркеры (worker.py)
+JOB_QUEUE = os.getenv('JOB_QUEUE', 'local')
+JOB_QUEUE_PATH = os.path.join(DATA_DIR, 'jobs.sqlite3')
+JOB_QUEUE_NAME = 'circle_jobs'                  # Префикс ключей в Redis
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+JOB_LEASE_SECONDS = 300         # Через сколько задачу упавшего воркера получит другой
+JOB_LEASE_RENEW_INTERVAL = JOB_LEASE_SECONDS / 3  # Как часто воркер продлевает аренду своей задачи
+JOB_MAX_ATTEMPTS = 3            # Максимум попыток на задачу
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', TRANSCODE_WORKERS))
+WORKER_POLL_INTERVAL = 1.0      # Пауза при пустой очереди, сек
+
+# Приём обновлений: 'polling' или 'webhook' (встроенный HTTP-сервер на aiohttp)
+RUN_MODE = os.getenv('RUN_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')              # Публичный https-адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('PORT', 8080))         # Хостинг передаёт порт через PORT
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')        # Общий для всех реплик секрет
+WEBHOOK_QUEUE_SIZE = 1000                           # Максимум принятых, но не обработанных обновлений
+WEBHOOK_MAX_CONNECTIONS = 40                        # Одновременных соединений от Telegram
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', 64))  # Обновлений в обработке одновременно (сообщения одного чата - по порядку)
+
+# Локальный HTTP-сервер с метриками (/metrics в формате Prometheus); порт 0 отключает
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+
+# Адрес Bot API (можно направить на локальный тестовый сервер)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL')
+TELEGRAM_FILE_BASE_URL = os.getenv('TELEGRAM_FILE_BASE_URL')
+# Прокси для Bot API и скачивания файлов, например http://proxy:3128 или socks5://...
+TELEGRAM_PROXY_URL = os.getenv('TELEGRAM_PROXY_URL')
 
 # Настройки логирования
 LOG_LEVEL = 'INFO'  # DEBUG, INFO, WARNING, ERROR, CRITICAL
@@ -66,9 +186,12 @@ MP4, AVI, MOV, MKV, WebM и другие
     ),
     
     'processing': '🔄 Обрабатываю видео...',
+    'queued': '⏳ Видео в очереди на обработку. Позиция: {position}',
+    'busy': '⏳ Сейчас слишком много видео в обработке. Попробуйте через {retry} сек.',
     'creating_circle': '🎬 Создаю видеокружок...',
     'sending': '📤 Отправляю видеокружок...',
     'error_file_size': f'❌ Файл слишком большой. Максимальный размер: {MAX_FILE_SIZE_MB}MB',
+    'error_duration': f'❌ Видео слишком длинное. Максимальная длительность: {MAX_DURATION_SECONDS} секунд',
     'error_no_video': '❌ Не удалось получить видео файл',
     'error_processing': '❌ Ошибка при обработке видео. Попробуйте другой файл.',
     'error_general': '❌ Произошла ошибка при обработке видео',
@@ -0,0 +1,46 @@
+"""
+Ограничение длительности видеокружка
+
+Лимит применяется на стороне входа ffmpeg (-t перед -i): демультиплексор
+перестаёт читать исходник, как только набрано нужное число секунд, а при
+потоковом чтении прекращается и скачивание. Слишком длинные ролики
+отсеиваются по длительности, которую сообщил Telegram, ещё до загрузки.
+"""
+
+import logging
+
+from config import MAX_DURATION_SECONDS, LONG_VIDEO_POLICY, MESSAGES
+
+logger = logging.getLogger(__name__)
+
+# Telegram не принимает видеокружки длиннее 60 секунд
+CLIP_LIMIT = min(60, MAX_DURATION_SECONDS)
+
+
+def input_limit_args():
+    """Параметры ffmpeg.input, ограничивающие чтение исходника"""
+    return {'t': CLIP_LIMIT}
+
+
+def is_too_long(media):
+    """Длиннее лимита по данным Telegram (у документов длительность часто неизвестна)"""
+    duration = getattr(media, 'duration', None)
+    return bool(duration) and duration > CLIP_LIMIT
+
+
+async def check_duration(media, reply):
+    """Проверяет длительность до скачивания.
+
+    При политике 'reject' отвечает ошибкой через reply и возвращает False;
+    при 'trim' ролик будет обрезан до CLIP_LIMIT секунд на входе ffmpeg.
+    """
+    if not is_too_long(media):
+        return True
+
+    if LONG_VIDEO_POLICY == 'reject':
+        logger.info(f"Видео {media.duration} сек отклонено до скачивания")
+        await reply(MESSAGES['error_duration'])
+        return False
+
+    logger.info(f"Видео {media.duration} сек будет обрезано до {CLIP_LIMIT} сек")
+    return True
@@ -0,0 +1,177 @@
+"""
+Подбор настроек x264 под конкретный ролик
+
+Планировщик оценивает время кодирования по длительности ролика,
+разрешению исходника и результата, загрузке очереди и числу ядер и
+выбирает самый качественный пресет, который укладывается в бюджет
+задержки. Фактическое время каждой задачи уточняет модель, поэтому
+оценки подстраиваются под железо, на котором запущен бот.
+"""
+
+import logging
+import threading
+
+from config import ENCODER_CORES, TRANSCODE_WORKERS, PLANNER_DEFAULT_FPS, PLANNER_SMOOTHING
+from duration_limit import CLIP_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Пресеты x264 от самого быстрого к самому качественному
+PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow')
+
+# Начальная оценка: секунд на мегапиксель-кадр на одном ядре
+PRESET_COST = {
+    'ultrafast': 0.004,
+    'superfast': 0.006,
+    'veryfast': 0.008,
+    'faster': 0.012,
+    'fast': 0.016,
+    'medium': 0.022,
+    'slow': 0.040
+}
+DECODE_COST = 0.002      # Декодирование и масштабирование исходника
+STARTUP_COST = 0.3       # Запуск процесса ffmpeg, сек
+THREAD_EFFICIENCY = 0.8  # Ускорение от N потоков ~ N ** 0.8
+
+# Размеры, если Telegram их не сообщил
+DEFAULT_SOURCE_SIZE = (1920, 1080)
+
+
+class EncoderPlan:
+    """Выбранные настройки кодирования и их оценка по времени"""
+
+    def __init__(self, preset, crf, bitrate, threads, rate_control='crf',
+                 predicted_seconds=0.0, factor=1.0):
+        self.preset = preset
+        self.crf = crf
+        self.bitrate = bitrate
+        self.threads = threads
+        self.rate_control = rate_control
+        self.predicted_seconds = predicted_seconds
+        self.factor = factor  # Поправочный коэффициент, с которым сделана оценка
+
+    def output_args(self):
+        """Параметры видеокодека для ffmpeg.output"""
+        rate = int(self.bitrate[:-1])
+        args = {
+            'vcodec': 'libx264',
+            'preset': self.preset,
+            'threads': self.threads,
+            'maxrate': self.bitrate,
+            'bufsize': f"{rate * 2}k"
+        }
+        if self.rate_control == 'vbr':
+            # Ограниченный VBR: размер и время предсказуемы даже на быстрых пресетах
+            args['b:v'] = self.bitrate
+        else:
+            args['crf'] = self.crf
+        return args
+
+    def __repr__(self):
+        return (f"EncoderPlan({self.preset}, {self.rate_control}, crf={self.crf}, "
+                f"bitrate={self.bitrate}, threads={self.threads}, "
+                f"~{self.predicted_seconds:.1f}s)")
+
+
+class EncoderPlanner:
+    def __init__(self, cores=ENCODER_CORES, max_workers=TRANSCODE_WORKERS,
+                 smoothing=PLANNER_SMOOTHING):
+        self.cores = cores
+        self.max_workers = max_workers
+        self.smoothing = smoothing
+        # Поправочные коэффициенты: фактическое время / оценка
+        self._global_factor = 1.0
+        self._factors = {}
+        self._lock = threading.Lock()
+
+    def _factor(self, preset):
+        with self._lock:
+            return self._factors.get(preset, self._global_factor)
+
+    def threads_per_job(self, queue_depth=0, in_flight=0):
+        """Сколько потоков дать одной задаче при текущей загрузке"""
+        concurrent = self.max_workers if queue_depth else min(self.max_workers, in_flight + 1)
+        return max(1, self.cores // max(1, concurrent))
+
+    def estimate(self, preset, size, duration=None, width=None, height=None, threads=1,
+                 fps=PLANNER_DEFAULT_FPS):
+        """Оценка времени кодирования ролика в секундах.
+
+        Кодируется не больше CLIP_LIMIT секунд: длинный ролик обрезается на входе.
+        """
+        if not duration:
+            duration = CLIP_LIMIT
+        duration = min(duration, CLIP_LIMIT)
+        if not width or not height:
+            width, height = DEFAULT_SOURCE_SIZE
+
+        frames = duration * fps
+        work = frames * (width * height * DECODE_COST + size * size * PRESET_COST[preset]) / 1e6
+        speedup = threads ** THREAD_EFFICIENCY
+        return STARTUP_COST + work * self._factor(preset) / speedup
+
+    def plan(self, settings, duration=None, width=None, height=None, budget=None,
+             queue_depth=0, in_flight=0, log=True):
+        """Подбирает настройки для ролика.
+
+        settings - уровень качества (size, crf, preset, bitrate): его пресет -
+        потолок качества. budget - допустимое время кодирования, сек; при
+        очереди оно делится между задачами, стоящими впереди. log=False -
+        только оценка (например, для подписей кнопок), без записи в журнал.
+        """
+        threads = self.threads_per_job(queue_depth, in_flight)
+        ceiling = PRESETS.index(settings['preset'])
+        size = settings['size']
+
+        if budget is None:
+            return EncoderPlan(
+                settings['preset'], settings['crf'], settings['bitrate'], threads,
+                predicted_seconds=self.estimate(settings['preset'], size, duration,
+                                                width, height, threads),
+                factor=self._factor(settings['preset'])
+            )
+
+        # Очередь впереди тоже входит в задержку, которую видит пользователь
+        budget = budget / (1 + queue_depth / max(1, self.max_workers))
+
+        for index in range(ceiling, -1, -1):
+            preset = PRESETS[index]
+            predicted = self.estimate(preset, size, duration, width, height, threads)
+            if predicted <= budget or index == 0:
+                break
+
+        downgraded = index < ceiling
+        # Быстрые пресеты при том же crf дают заметно большие файлы
+        rate_control = 'vbr' if downgraded else 'crf'
+
+        plan = EncoderPlan(
+            preset, settings['crf'], settings['bitrate'], threads,
+            rate_control=rate_control, predicted_seconds=predicted,
+            factor=self._factor(preset)
+        )
+        if downgraded and log:
+            logger.info(f"Пресет понижен с {settings['preset']} до {preset} "
+                        f"под бюджет {budget:.1f}s: {plan}")
+        return plan
+
+    def record(self, plan, elapsed):
+        """Уточняет модель по фактическому времени кодирования"""
+        if not plan.predicted_seconds or elapsed <= 0:
+            return
+
+        # Коэффициент, при котором оценка совпала бы с фактом
+        work = max(plan.predicted_seconds - STARTUP_COST, 1e-3)
+        ratio = min(max((elapsed - STARTUP_COST) / work, 0.1), 10.0)
+        target = plan.factor * ratio
+        alpha = self.smoothing
+        with self._lock:
+            current = self._factors.get(plan.preset, self._global_factor)
+            self._factors[plan.preset] = current + alpha * (target - current)
+            self._global_factor += alpha * (target - self._global_factor)
+
+        logger.debug(f"Кодирование {plan.preset}: оценка {plan.predicted_seconds:.1f}s, "
+                     f"факт {elapsed:.1f}s")
+
+
+# Общий планировщик: калибровка накапливается за всё время работы бота
+encoder_planner = EncoderPlanner()
@@ -0,0 +1,341 @@
+"""
+Локальная замена Telegram Bot API для нагрузочного тестирования
+
+Сервер на aiohttp реализует методы, которые вызывает бот: getMe,
+getUpdates, setWebhook/deleteWebhook, getFile и скачивание файла,
+sendMessage, editMessageText, deleteMessage, answerCallbackQuery и
+sendVideoNote. Бот подключается к нему через TELEGRAM_API_BASE_URL и
+TELEGRAM_FILE_BASE_URL (см. webhook.build_application):
+
+  TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot
+  TELEGRAM_FILE_BASE_URL=http://127.0.0.1:8081/file/bot
+
+Обновления (видео и нажатия кнопок) создаёт тест через FakeBotApi.send_video
+и FakeBotApi.press_button. Бот получает их через getUpdates, а если он вызвал
+setWebhook, сервер отправляет их POST-запросом на его адрес. Всё, что бот
+отправил в чат, складывается в очередь событий этого чата (FakeBotApi.events).
+Тело sendVideoNote читается потоком и не хранится.
+"""
+
+import json
+import time
+import asyncio
+import logging
+import itertools
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать подтверждения webhook-сервера бота, сек
+WEBHOOK_DELIVERY_TIMEOUT = 10
+WEBHOOK_RETRY_DELAY = 0.5
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Fake Bot', 'username': 'fake_circle_bot'}
+
+
+class ApiError(Exception):
+    """Ответ Bot API с ошибкой"""
+
+    def __init__(self, status, description):
+        super().__init__(description)
+        self.status = status
+        self.description = description
+
+
+class ChatEvent:
+    """Вызов API ботом в адрес чата"""
+
+    def __init__(self, method, message=None, payload=None):
+        self.method = method
+        self.message = message or {}
+        self.payload = payload or {}
+        self.at = time.monotonic()
+
+    @property
+    def text(self):
+        return self.message.get('text', '')
+
+    def __repr__(self):
+        return f"ChatEvent({self.method}, {self.text!r})"
+
+
+class FakeBotApi:
+    def __init__(self):
+        self.files = {}        # file_id -> (путь, размер)
+        self.messages = {}     # (chat_id, message_id) -> сообщение
+        self.events = {}       # chat_id -> asyncio.Queue с ChatEvent
+        self.calls = {}        # метод -> количество вызовов
+        self.uploaded_bytes = 0
+        self.webhook = None    # (url, secret_token), если бот вызвал setWebhook
+
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._updates = []     # Ожидающие getUpdates
+        self._updates_ready = asyncio.Condition()
+        self._webhook_queue = asyncio.Queue()
+        self._webhook_task = None
+        self._session = None
+
+    # --- Действия пользователей ---
+
+    def add_file(self, file_id, path, size):
+        """Файл, который бот сможет скачать через getFile"""
+        self.files[file_id] = (path, size)
+
+    def chat_events(self, chat_id):
+        queue = self.events.get(chat_id)
+        if queue is None:
+            queue = self.events[chat_id] = asyncio.Queue()
+        return queue
+
+    def _user(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'}
+
+    def _new_message(self, chat_id, sender, **fields):
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': sender,
+            **fields
+        }
+        self.messages[(chat_id, message['message_id'])] = message
+        return message
+
+    async def send_video(self, user_id, file_id, file_unique_id, width, height, duration, size):
+        """Пользователь отправляет видео; возвращает сообщение"""
+        self.chat_events(user_id)
+        message = self._new_message(user_id, self._user(user_id), video={
+            'file_id': file_id,
+            'file_unique_id': file_unique_id,
+            'width': width,
+            'height': height,
+            'duration': duration,
+            'mime_type': 'video/mp4',
+            'file_size': size
+        })
+        await self._push_update({'message': message})
+        return message
+
+    async def press_button(self, user_id, message, callback_data):
+        """Пользователь нажимает кнопку под сообщением бота"""
+        await self._push_update({'callback_query': {
+            'id': str(next(self._update_ids)),
+            'from': self._user(user_id),
+            'message': message,
+            'chat_instance': str(user_id),
+            'data': callback_data
+        }})
+
+    async def _push_update(self, update):
+        update['update_id'] = next(self._update_ids)
+        if self.webhook is not None:
+            await self._webhook_queue.put(update)
+            return
+        async with self._updates_ready:
+            self._updates.append(update)
+            self._updates_ready.notify_all()
+
+    # --- Методы Bot API ---
+
+    async def get_me(self, params):
+        return BOT_USER
+
+    async def get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+
+        async with self._updates_ready:
+            # offset подтверждает все обновления до него
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            if not self._updates and timeout:
+                try:
+                    await asyncio.wait_for(self._updates_ready.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self._updates[:limit]
+
+    async def set_webhook(self, params):
+        self.webhook = (params['url'], params.get('secret_token', ''))
+        if self._webhook_task is None:
+            self._webhook_task = asyncio.create_task(self._deliver_webhooks())
+        # Накопленные для getUpdates обновления уходят на webhook
+        async with self._updates_ready:
+            for update in self._updates:
+                await self._webhook_queue.put(update)
+            self._updates = []
+        return True
+
+    async def delete_webhook(self, params):
+        self.webhook = None
+        return True
+
+    async def get_file(self, params):
+        file_id = params['file_id']
+        if file_id not in self.files:
+            raise ApiError(400, 'Bad Request: invalid file_id')
+        _, size = self.files[file_id]
+        return {
+            'file_id': file_id,
+            'file_unique_id': file_id,
+            'file_size': size,
+            'file_path': f'videos/{file_id}.mp4'
+        }
+
+    async def send_message(self, params):
+        chat_id = int(params['chat_id'])
+        fields = {'text': params['text']}
+        if params.get('reply_markup'):
+            fields['reply_markup'] = json.loads(params['reply_markup'])
+        message = self._new_message(chat_id, BOT_USER, **fields)
+        await self.chat_events(chat_id).put(ChatEvent('sendMessage', message))
+        return message
+
+    async def edit_message_text(self, params):
+        chat_id = int(params['chat_id'])
+        message = self.messages.get((chat_id, int(params['message_id'])))
+        if message is None:
+            raise ApiError(400, 'Bad Request: message to edit not found')
+        if message.get('text') == params['text'] and not params.get('reply_markup'):
+            # Как в Telegram: правка без изменений - ошибка
+            raise ApiError(400, 'Bad Request: message is not modified')
+        message['text'] = params['text']
+        message.pop('reply_markup', None)
+        if params.get('reply_markup'):
+            message['reply_markup'] = json.loads(params['reply_markup'])
+        message['edit_date'] = int(time.time())
+        await self.chat_events(chat_id).put(ChatEvent('editMessageText', dict(message)))
+        return message
+
+    async def delete_message(self, params):
+        chat_id = int(params['chat_id'])
+        message = self.messages.pop((chat_id, int(params['message_id'])), None)
+        await self.chat_events(chat_id).put(ChatEvent('deleteMessage', message))
+        return True
+
+    async def answer_callback_query(self, params):
+        return True
+
+    async def send_video_note(self, params):
+        chat_id = int(params['chat_id'])
+        video_note = params['video_note']
+        message = self._new_message(chat_id, BOT_USER, video_note={
+            # Повторная отправка по file_id из кэша результатов
+            'file_id': video_note if isinstance(video_note, str) else f'note-{chat_id}-{time.monotonic_ns()}',
+            'file_unique_id': f'note-{time.monotonic_ns()}',
+            'length': int(params.get('length') or 240),
+            'duration': int(params.get('duration') or 1)
+        })
+        await self.chat_events(chat_id).put(ChatEvent('sendVideoNote', message, params))
+        return message
+
+    METHODS = {
+        'getme': get_me,
+        'getupdates': get_updates,
+        'setwebhook': set_webhook,
+        'deletewebhook': delete_webhook,
+        'getfile': get_file,
+        'sendmessage': send_message,
+        'editmessagetext': edit_message_text,
+        'deletemessage': delete_message,
+        'answercallbackquery': answer_callback_query,
+        'sendvideonote': send_video_note
+    }
+
+    # --- HTTP ---
+
+    async def _read_params(self, request):
+        """Параметры запроса: query, JSON, urlencoded или multipart (файлы читаются потоком)"""
+        params = dict(request.query)
+        if request.content_type == 'application/json':
+            params.update(await request.json())
+        elif request.content_type == 'multipart/form-data':
+            reader = await request.multipart()
+            async for part in reader:
+                if part.filename is None:
+                    params[part.name] = await part.text()
+                    continue
+                size = 0
+                while True:
+                    chunk = await part.read_chunk()
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                self.uploaded_bytes += size
+                params[part.name] = {'filename': part.filename, 'size': size}
+        elif request.can_read_body:
+            params.update(await request.post())
+        return params
+
+    async def handle_method(self, request):
+        method = request.match_info['method'].lower()
+        self.calls[method] = self.calls.get(method, 0) + 1
+        handler = self.METHODS.get(method)
+        if handler is None:
+            return web.json_response(
+                {'ok': False, 'error_code': 404, 'description': 'Not Found'}, status=404
+            )
+        try:
+            params = await self._read_params(request)
+            result = await handler(self, params)
+        except ApiError as e:
+            return web.json_response(
+                {'ok': False, 'error_code': e.status, 'description': e.description}, status=e.status
+            )
+        except (KeyError, ValueError) as e:
+            return web.json_response(
+                {'ok': False, 'error_code': 400, 'description': f'Bad Request: {e}'}, status=400
+            )
+        return web.json_response({'ok': True, 'result': result})
+
+    async def handle_file(self, request):
+        file_id = request.match_info['file_path'].rsplit('/', 1)[-1].rsplit('.', 1)[0]
+        if file_id not in self.files:
+            raise web.HTTPNotFound()
+        path, _ = self.files[file_id]
+        return web.FileResponse(path)
+
+    async def _deliver_webhooks(self):
+        """Отправляет обновления на webhook бота; при отказе повторяет"""
+        self._session = aiohttp.ClientSession()
+        while True:
+            update = await self._webhook_queue.get()
+            while self.webhook is not None:
+                url, secret_token = self.webhook
+                try:
+                    async with self._session.post(
+                        url, json=update,
+                        headers={'X-Telegram-Bot-Api-Secret-Token': secret_token},
+                        timeout=aiohttp.ClientTimeout(total=WEBHOOK_DELIVERY_TIMEOUT)
+                    ) as response:
+                        if response.status == 200:
+                            break
+                        logger.debug(f"Webhook ответил {response.status}, повтор")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.debug(f"Webhook недоступен: {e}")
+                await asyncio.sleep(WEBHOOK_RETRY_DELAY)
+
+    def create_app(self):
+        web_app = web.Application(client_max_size=1024 ** 3)
+        web_app.router.add_route('*', '/bot{token}/{method}', self.handle_method)
+        web_app.router.add_get('/file/bot{token}/{file_path:.+}', self.handle_file)
+        web_app.on_cleanup.append(self._cleanup)
+        return web_app
+
+    async def _cleanup(self, web_app):
+        if self._webhook_task is not None:
+            self._webhook_task.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+
+async def start_fake_bot_api(api, host='127.0.0.1', port=8081):
+    """Запускает сервер; возвращает runner для остановки"""
+    runner = web.AppRunner(api.create_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Тестовый Bot API: http://{host}:{port}/bot<token>/")
+    return runner
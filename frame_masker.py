@@ -0,0 +1,54 @@
+"""
+Векторизованное наложение круглой маски на кадры средствами NumPy
+
+Маска строится один раз, кадры маскируются на месте в буфере декодера
+без промежуточных PIL-изображений и без выделения памяти на каждый кадр.
+"""
+
+import numpy as np
+
+from config import FRAME_BATCH_SIZE
+
+
+class FrameMasker:
+    def __init__(self, mask, batch_size=FRAME_BATCH_SIZE):
+        """mask - маска 'L' (PIL или массив): 255 внутри круга, 0 снаружи"""
+        inside = np.asarray(mask, dtype=np.uint8) > 127
+        self.size = inside.shape[0]
+        self.batch_size = batch_size
+
+        # Логическая маска внешней области с осью каналов для broadcasting
+        self._outside = np.ascontiguousarray(~inside)[:, :, np.newaxis]
+
+        # Переиспользуемый буфер под пачку кадров BGR
+        self.batch = np.empty(
+            (batch_size, self.size, self.size, 3), dtype=np.uint8
+        )
+
+    def apply(self, frame):
+        """Зачерняет область вне круга в одном кадре на месте"""
+        np.copyto(frame, 0, where=self._outside)
+        return frame
+
+    def apply_batch(self, frames):
+        """Зачерняет область вне круга во всей пачке кадров за один вызов"""
+        np.copyto(frames, 0, where=self._outside)
+        return frames
+
+    def read_batch(self, cap):
+        """Читает до batch_size кадров из cv2.VideoCapture прямо в буфер.
+
+        Возвращает маскированный срез буфера; пустой срез - конец видео.
+        """
+        count = 0
+        while count < self.batch_size:
+            slot = self.batch[count]
+            ret, frame = cap.read(slot)
+            if not ret:
+                break
+            # OpenCV может вернуть новый массив, если не смог писать в буфер
+            if not np.shares_memory(frame, slot):
+                np.copyto(slot, frame)
+            count += 1
+
+        return self.apply_batch(self.batch[:count])
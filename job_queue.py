@@ -0,0 +1,287 @@
+"""
+Распределённая очередь задач на создание видеокружков
+
+Фронтенды, принимающие обновления Telegram, кладут в брокер задачу
+(file_id, chat_id, качество, сообщение для ответа), а воркеры (worker.py)
+забирают её, кодируют и отправляют результат. Так кодировщики
+масштабируются отдельно от приёма обновлений.
+
+Забранная задача получает аренду на JOB_LEASE_SECONDS, которую воркер
+продлевает, пока работает над задачей (renew). Если воркер упал, по
+истечении аренды задачу заберёт другой воркер (не больше
+JOB_MAX_ATTEMPTS попыток). Брокер 'sqlite' подходит для одной машины и
+тестов, 'redis' - для нескольких машин.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+
+from config import (
+    JOB_QUEUE, JOB_QUEUE_PATH, JOB_QUEUE_NAME, REDIS_URL,
+    JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteBroker:
+    def __init__(self, path=JOB_QUEUE_PATH, lease=JOB_LEASE_SECONDS,
+                 max_attempts=JOB_MAX_ATTEMPTS):
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        # Транзакции открываются явно: BEGIN IMMEDIATE сериализует воркеры разных процессов
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            '''CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL,
+                created_at REAL NOT NULL
+            )'''
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)')
+
+    def _enqueue(self, job):
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO jobs (payload, created_at) VALUES (?, ?)',
+                (json.dumps(job, separators=(',', ':')), time.time())
+            )
+            return self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'pending'"
+            ).fetchone()[0]
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                # Аренда истекла, а попытки исчерпаны - задача больше не выдаётся
+                self._db.execute(
+                    "DELETE FROM jobs WHERE state = 'running' AND lease_until < ? AND attempts >= ?",
+                    (now, self.max_attempts)
+                )
+                row = self._db.execute(
+                    "SELECT id, payload, attempts FROM jobs "
+                    "WHERE state = 'pending' OR (state = 'running' AND lease_until < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET state = 'running', attempts = attempts + 1, "
+                        "lease_until = ? WHERE id = ?",
+                        (now + self.lease, row[0])
+                    )
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+
+        if row is None:
+            return None
+        job_id, payload, attempts = row
+        return {**json.loads(payload), 'id': job_id, 'attempts': attempts + 1}
+
+    def _renew(self, job_id):
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND state = 'running'",
+                (time.time() + self.lease, job_id)
+            )
+            return cursor.rowcount > 0
+
+    def _complete(self, job_id):
+        with self._lock:
+            self._db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def _fail(self, job_id, retry):
+        with self._lock:
+            if retry:
+                self._db.execute(
+                    "UPDATE jobs SET state = 'pending', lease_until = NULL "
+                    "WHERE id = ? AND attempts < ?",
+                    (job_id, self.max_attempts)
+                )
+            self._db.execute("DELETE FROM jobs WHERE id = ? AND state = 'running'", (job_id,))
+
+    def _depth(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'pending'"
+            ).fetchone()[0]
+
+    async def enqueue(self, job):
+        """Ставит задачу в очередь и возвращает число ожидающих задач"""
+        return await asyncio.to_thread(self._enqueue, job)
+
+    async def claim(self):
+        """Забирает следующую задачу под аренду; None, если очередь пуста"""
+        return await asyncio.to_thread(self._claim)
+
+    async def renew(self, job_id):
+        """Продлевает аренду задачи; False, если задача уже не за этим воркером"""
+        return await asyncio.to_thread(self._renew, job_id)
+
+    async def complete(self, job_id):
+        """Удаляет выполненную задачу"""
+        await asyncio.to_thread(self._complete, job_id)
+
+    async def fail(self, job_id, retry=True):
+        """Возвращает задачу в очередь или удаляет, если попытки исчерпаны"""
+        await asyncio.to_thread(self._fail, job_id, retry)
+
+    async def depth(self):
+        return await asyncio.to_thread(self._depth)
+
+    async def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# Забор задачи одним шагом: просроченные аренды возвращаются в голову очереди
+# (RPUSH - их заберут первыми, как и в SqliteBroker с ORDER BY id),
+# следующая задача снимается с очереди и сразу получает аренду. Если воркер
+# упадёт в любой момент, задача останется либо в очереди, либо в аренде.
+# KEYS: pending, jobs, leases, attempts; ARGV: now, lease, max_attempts.
+# Ответ: nil - очередь пуста, {id} - задача уже удалена, {id, attempts} -
+# попытки исчерпаны, {id, attempts, payload} - задача выдана.
+CLAIM_SCRIPT = """
+local now = tonumber(ARGV[1])
+-- С конца: раньше всех истёкшая аренда окажется в самой голове очереди
+local expired = redis.call('ZRANGEBYSCORE', KEYS[3], 0, now)
+for i = #expired, 1, -1 do
+    redis.call('ZREM', KEYS[3], expired[i])
+    redis.call('RPUSH', KEYS[1], expired[i])
+end
+
+local id = redis.call('RPOP', KEYS[1])
+if not id then
+    return nil
+end
+local payload = redis.call('HGET', KEYS[2], id)
+if not payload then
+    return {id}
+end
+local attempts = redis.call('HINCRBY', KEYS[4], id, 1)
+if attempts > tonumber(ARGV[3]) then
+    redis.call('HDEL', KEYS[2], id)
+    redis.call('HDEL', KEYS[4], id)
+    return {id, attempts}
+end
+redis.call('ZADD', KEYS[3], now + tonumber(ARGV[2]), id)
+return {id, attempts, payload}
+"""
+
+# Возврат задачи воркером: только если аренда ещё у него; повтор - в голову очереди.
+# KEYS: pending, jobs, leases, attempts; ARGV: id, retry (0/1), max_attempts.
+FAIL_SCRIPT = """
+if redis.call('ZREM', KEYS[3], ARGV[1]) == 0 then
+    return 0
+end
+local attempts = tonumber(redis.call('HGET', KEYS[4], ARGV[1]) or '0')
+if ARGV[2] == '1' and attempts < tonumber(ARGV[3]) then
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+else
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[4], ARGV[1])
+end
+return 1
+"""
+
+
+class RedisBroker:
+    """Очередь в Redis: список id задач, хэши с телами задач и попытками, zset аренд"""
+
+    def __init__(self, url=REDIS_URL, name=JOB_QUEUE_NAME, lease=JOB_LEASE_SECONDS,
+                 max_attempts=JOB_MAX_ATTEMPTS):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("Для JOB_QUEUE=redis установите пакет redis")
+
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._redis = aioredis.from_url(url, decode_responses=True)
+        self._pending = f'{name}:pending'
+        self._jobs = f'{name}:jobs'
+        self._leases = f'{name}:leases'
+        self._attempts = f'{name}:attempts'
+        self._ids = f'{name}:ids'
+        self._keys = [self._pending, self._jobs, self._leases, self._attempts]
+        self._claim_script = self._redis.register_script(CLAIM_SCRIPT)
+        self._fail_script = self._redis.register_script(FAIL_SCRIPT)
+
+    async def enqueue(self, job):
+        """Ставит задачу в очередь и возвращает число ожидающих задач"""
+        job_id = await self._redis.incr(self._ids)
+        payload = json.dumps({**job, 'id': job_id}, separators=(',', ':'))
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._jobs, job_id, payload)
+            pipe.lpush(self._pending, job_id)
+            _, depth = await pipe.execute()
+        return depth
+
+    async def claim(self):
+        """Забирает следующую задачу под аренду; None, если очередь пуста"""
+        item = await self._claim_script(
+            keys=self._keys, args=[time.time(), self.lease, self.max_attempts]
+        )
+        if item is None or len(item) < 3:
+            if item is not None and len(item) == 2:
+                logger.error(f"Задача #{item[0]} исчерпала попытки и удалена")
+            return None
+
+        _, attempts, payload = item
+        return {**json.loads(payload), 'attempts': int(attempts)}
+
+    async def renew(self, job_id):
+        """Продлевает аренду задачи; False, если задача уже не за этим воркером"""
+        # xx: аренду, которую уже вернули в очередь, не восстанавливаем
+        return bool(await self._redis.zadd(
+            self._leases, {job_id: time.time() + self.lease}, xx=True, ch=True
+        ))
+
+    async def complete(self, job_id):
+        """Удаляет выполненную задачу"""
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self._leases, job_id)
+            pipe.hdel(self._jobs, job_id)
+            pipe.hdel(self._attempts, job_id)
+            await pipe.execute()
+
+    async def fail(self, job_id, retry=True):
+        """Возвращает задачу в очередь или удаляет, если попытки исчерпаны"""
+        await self._fail_script(
+            keys=self._keys, args=[job_id, 1 if retry else 0, self.max_attempts]
+        )
+
+    async def depth(self):
+        return await self._redis.llen(self._pending)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def create_broker(backend=JOB_QUEUE):
+    """Создаёт брокер по настройке JOB_QUEUE; None для 'local' (без очереди)"""
+    if backend == 'local':
+        return None
+    if backend == 'sqlite':
+        return SqliteBroker()
+    if backend == 'redis':
+        return RedisBroker()
+    raise ValueError(f"Неизвестный брокер очереди задач: {backend}")
@@ -0,0 +1,129 @@
+"""
+Прежний трёхэтапный конвейер видеокружка: ffmpeg → маска OpenCV/NumPy → ffmpeg mux
+
+Кадры декодируются, маскируются и кодируются в одном процессе, поэтому
+функция предназначена для запуска в пуле процессов (см. process_backend):
+кадры не пересекают границу процесса и не копируются между процессами.
+"""
+
+import os
+import logging
+
+import cv2
+import ffmpeg
+from PIL import Image, ImageDraw
+
+from config import VIDEO_CIRCLE_SIZE, VIDEO_CODEC, AUDIO_CODEC, CRF_VALUE
+from duration_limit import input_limit_args
+from frame_masker import FrameMasker
+from circle_engine import StageTimings
+from video_metadata import get_video_metadata
+
+logger = logging.getLogger(__name__)
+
+
+def create_circular_mask(size):
+    """Создает круглую маску для видео"""
+    mask = Image.new('L', (size, size), 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse((0, 0, size, size), fill=255)
+    return mask
+
+
+def process_video_to_circle_legacy(input_path, output_path, circle_size=VIDEO_CIRCLE_SIZE,
+                                   timings=None, crf=CRF_VALUE, preset='fast'):
+    """Трёхэтапная конвертация: ffmpeg → OpenCV/PIL маска → ffmpeg mux.
+
+    Время каждого этапа (square, mask, mux) записывается в timings.
+    """
+    timings = timings or StageTimings()
+    try:
+        # Получаем информацию о видео (заголовок файла, ffprobe - только если не хватило)
+        metadata = get_video_metadata(input_path)
+
+        width = metadata.width
+        height = metadata.height
+
+        # Определяем размер квадрата (минимальная сторона)
+        size = min(width, height)
+
+        # Вычисляем координаты для центрирования
+        x_offset = (width - size) // 2
+        y_offset = (height - size) // 2
+
+        # Промежуточные файлы лежат в директории задачи рядом с выходом
+        job_dir = os.path.dirname(output_path)
+        temp_square_path = os.path.join(job_dir, 'square.mp4')
+
+        # Обрезаем видео до квадрата и масштабируем до размера видеокружка
+        with timings.stage('square'):
+            (
+                ffmpeg
+                .input(input_path, **input_limit_args())
+                .filter('crop', size, size, x_offset, y_offset)
+                .filter('scale', circle_size, circle_size)
+                .output(
+                    temp_square_path, 
+                    vcodec=VIDEO_CODEC, 
+                    acodec=AUDIO_CODEC,
+                    crf=crf,
+                    preset=preset
+                )
+                .overwrite_output()
+                .run(quiet=True, capture_stdout=True, capture_stderr=True)
+            )
+
+        # Применяем круглую маску
+        with timings.stage('mask'):
+            cap = cv2.VideoCapture(temp_square_path)
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            fps = cap.get(cv2.CAP_PROP_FPS)
+
+            # Файл для видео с маской (без звука)
+            temp_result_path = os.path.join(job_dir, 'masked.mp4')
+
+            out = cv2.VideoWriter(temp_result_path, fourcc, fps, (circle_size, circle_size))
+
+            # Создаем круглую маску и буфер кадров один раз на видео
+            masker = FrameMasker(create_circular_mask(circle_size))
+
+            while True:
+                # Кадры читаются пачкой прямо в буфер и маскируются на месте
+                frames = masker.read_batch(cap)
+                if not len(frames):
+                    break
+
+                for frame in frames:
+                    out.write(frame)
+
+            cap.release()
+            out.release()
+
+        # Объединяем видео со звуком
+        with timings.stage('mux'):
+            (
+                ffmpeg
+                .output(
+                    ffmpeg.input(temp_result_path)['v'],
+                    ffmpeg.input(temp_square_path)['a'],
+                    output_path,
+                    vcodec='copy',
+                    acodec='aac',
+                    shortest=None
+                )
+                .overwrite_output()
+                .run(quiet=True)
+            )
+
+        # Удаляем временные файлы
+        os.unlink(temp_square_path)
+        os.unlink(temp_result_path)
+
+        return True
+
+    except ffmpeg.Error as e:
+        logger.error(f"Ошибка ffmpeg: {e.stderr.decode() if e.stderr else str(e)}")
+        return False
+    except Exception as e:
+        logger.error(f"Ошибка при обработке видео: {e}")
+        return False
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест бота целиком на локальном Bot API (fake_bot_api)
+
+Запускает тестовый Bot API и выбранную точку входа (bot_*.py), настроенную
+на него. Синтетические пользователи приходят пуассоновским потоком,
+отправляют видео, при выборе качества через некоторое время нажимают
+кнопку и ждут видеокружок. Итог по всем пользователям:
+
+  - сколько кружков получено, сколько видео отклонено контролем допуска,
+    сколько закончилось ошибкой или не дождалось ответа;
+  - p50/p95/p99 сквозной задержки (от отправки видео до sendVideoNote,
+    без времени «раздумий» пользователя) и первого ответа бота;
+  - пропускная способность, кружков в секунду.
+
+Видео - синтетический ролик из benchmark.generate_clip. По умолчанию у
+каждой отправки свой file_unique_id, чтобы кэш результатов не подменял
+обработку; --same-file проверяет как раз отдачу из кэша.
+
+Примеры:
+  python load_test.py --bot bot_final --users 2000 --rate 20
+  python load_test.py --bot bot_fast --users 500 --rate 50 --output load.json
+  python load_test.py --users 100     # бот запущен отдельно на порт 8081
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from config import MESSAGES
+from benchmark import SHAPES, generate_clip
+from fake_bot_api import FakeBotApi, start_fake_bot_api
+
+FAKE_TOKEN = '123456:fake-load-test-token'
+
+# Начало ответа контроля допуска (см. admission.py)
+BUSY_PREFIX = MESSAGES['busy'].split('{')[0]
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def choose_button(keyboard, quality):
+    """callback_data кнопки нужного качества (или случайной)"""
+    buttons = [button for row in keyboard for button in row if button.get('callback_data')]
+    if quality != 'random':
+        for button in buttons:
+            # callback_data: <префикс><качество>:<токен>
+            if button['callback_data'].split(':')[0].endswith(quality):
+                return button['callback_data']
+    return random.choice(buttons)['callback_data']
+
+
+async def run_user(api, user_id, clip, video_number, args):
+    """Пользователь отправляет видео и ждёт кружок; возвращает итог"""
+    file_id = f'video-{video_number}'
+    file_unique_id = 'video-shared' if args.same_file else f'unique-{video_number}'
+    api.add_file(file_id, clip['path'], clip['size'])
+
+    events = api.chat_events(user_id)
+    started = time.monotonic()
+    think_time = 0.0
+    first_response = None
+    await api.send_video(
+        user_id, file_id, file_unique_id,
+        clip['width'], clip['height'], clip['duration'], clip['size']
+    )
+
+    outcome = 'timeout'
+    deadline = started + args.timeout
+    while True:
+        try:
+            event = await asyncio.wait_for(events.get(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            break
+        if first_response is None:
+            first_response = event.at - started
+
+        if event.method == 'sendVideoNote':
+            outcome = 'ok'
+            break
+        if event.text.startswith(BUSY_PREFIX):
+            outcome = 'rejected'
+            break
+        if event.text.startswith('❌'):
+            outcome = 'error'
+            break
+
+        keyboard = event.message.get('reply_markup', {}).get('inline_keyboard')
+        if event.method == 'sendMessage' and keyboard:
+            pause = random.uniform(0, 2 * args.think)
+            await asyncio.sleep(pause)
+            think_time += pause
+            await api.press_button(user_id, event.message, choose_button(keyboard, args.quality))
+
+    finished = time.monotonic()
+    return {
+        'user_id': user_id,
+        'outcome': outcome,
+        'latency': finished - started - think_time,
+        'first_response': first_response,
+        'finished_at': finished
+    }
+
+
+async def wait_for_bot(api, process, timeout=60):
+    """Ждёт, пока бот начнёт забирать обновления"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if api.calls.get('getupdates') or api.webhook is not None:
+            return True
+        if process is not None and process.poll() is not None:
+            return False
+        await asyncio.sleep(0.2)
+    return False
+
+
+def start_bot(module, host, port, data_dir):
+    """Запускает точку входа, настроенную на тестовый Bot API"""
+    env = {
+        **os.environ,
+        'TELEGRAM_BOT_TOKEN': FAKE_TOKEN,
+        'TELEGRAM_API_BASE_URL': f'http://{host}:{port}/bot',
+        'TELEGRAM_FILE_BASE_URL': f'http://{host}:{port}/file/bot',
+        # Чистый кэш результатов и хранилища на каждый запуск
+        'DATA_DIR': data_dir
+    }
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'{module}.py')
+    return subprocess.Popen([sys.executable, script], env=env)
+
+
+def summarize(results, elapsed, api):
+    ok = [r for r in results if r['outcome'] == 'ok']
+    latencies = [r['latency'] for r in ok]
+    first = [r['first_response'] for r in results if r['first_response'] is not None]
+
+    def stats(values):
+        return {
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+            'max': max(values) if values else None
+        }
+
+    outcomes = {}
+    for r in results:
+        outcomes[r['outcome']] = outcomes.get(r['outcome'], 0) + 1
+
+    return {
+        'videos': len(results),
+        'outcomes': outcomes,
+        'elapsed_seconds': elapsed,
+        'throughput_per_second': len(ok) / elapsed if elapsed else None,
+        'latency_seconds': stats(latencies),
+        'first_response_seconds': stats(first),
+        'api_calls': dict(sorted(api.calls.items())),
+        'uploaded_mb': api.uploaded_bytes / 1024 / 1024
+    }
+
+
+def print_summary(summary):
+    def fmt(value):
+        return f"{value:.2f}" if value is not None else '-'
+
+    print(f"\n📊 Видео: {summary['videos']}, итоги: {summary['outcomes']}")
+    print(f"⏱ Длительность: {summary['elapsed_seconds']:.1f} сек, "
+          f"пропускная способность: {fmt(summary['throughput_per_second'])} кружков/сек")
+    for title, key in (('Сквозная задержка', 'latency_seconds'), ('Первый ответ', 'first_response_seconds')):
+        s = summary[key]
+        print(f"{title}: p50 {fmt(s['p50'])}  p95 {fmt(s['p95'])}  p99 {fmt(s['p99'])}  max {fmt(s['max'])} сек")
+    print(f"Вызовы API: {summary['api_calls']}")
+    print(f"Загружено видеокружков: {summary['uploaded_mb']:.1f} МБ")
+
+
+async def run_load(args):
+    clip_path = generate_clip(args.shape, args.duration, 'h264')
+    width, height = SHAPES[args.shape]
+    clip = {
+        'path': clip_path,
+        'size': os.path.getsize(clip_path),
+        'width': width,
+        'height': height,
+        'duration': args.duration
+    }
+
+    api = FakeBotApi()
+    runner = await start_fake_bot_api(api, args.host, args.port)
+    process = None
+    data_dir = tempfile.mkdtemp(prefix='load_test_')
+    try:
+        if args.bot:
+            process = start_bot(args.bot, args.host, args.port, data_dir)
+        print("⏳ Жду подключения бота...")
+        if not await wait_for_bot(api, process):
+            print("❌ Бот не начал получать обновления")
+            return None
+
+        print(f"🚀 {args.users} пользователей, {args.rate}/сек")
+        started = time.monotonic()
+        tasks = []
+        for number in range(args.users):
+            tasks.append(asyncio.create_task(run_user(api, 1000 + number, clip, number, args)))
+            # Пуассоновский поток прихода пользователей
+            await asyncio.sleep(random.expovariate(args.rate))
+        results = await asyncio.gather(*tasks)
+        elapsed = max(r['finished_at'] for r in results) - started
+
+        summary = summarize(results, elapsed, api)
+        summary['bot'] = args.bot
+        summary['users'] = args.users
+        summary['rate'] = args.rate
+        return summary
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        await runner.cleanup()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на локальном Bot API")
+    parser.add_argument('--bot', help="точка входа для запуска, например bot_final (без неё бот запускается отдельно)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=10.0, help="новых видео в секунду")
+    parser.add_argument('--quality', default='random', help="ключ уровня качества или random")
+    parser.add_argument('--think', type=float, default=1.0, help="среднее время до нажатия кнопки, сек")
+    parser.add_argument('--timeout', type=float, default=300.0, help="сколько пользователь ждёт кружок, сек")
+    parser.add_argument('--shape', default='landscape', choices=tuple(SHAPES))
+    parser.add_argument('--duration', type=int, default=10)
+    parser.add_argument('--same-file', action='store_true', help="все отправляют одно видео (кэш результатов)")
+    parser.add_argument('--output', help="записать итог в JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    summary = asyncio.run(run_load(args))
+    if summary is None:
+        sys.exit(1)
+
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"📄 Итог: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
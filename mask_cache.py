@@ -0,0 +1,90 @@
+"""
+Кэш круглых масок для видеокружков
+
+Маска каждого размера рисуется один раз на процесс и сохраняется на диск,
+после чего переиспользуется всеми задачами через фильтр overlay вместо
+попиксельного вычисления sqrt() в geq на каждом кадре.
+"""
+
+import os
+import logging
+import threading
+
+from PIL import Image, ImageDraw, ImageOps
+
+from config import MASK_CACHE_DIR, MASK_ANTIALIAS, MASK_SIZES
+
+logger = logging.getLogger(__name__)
+
+# Во сколько раз увеличивается холст при сглаживании краёв
+SUPERSAMPLE = 4
+
+_masks = {}
+_paths = {}
+_lock = threading.Lock()
+
+
+def _render_mask(size, antialias):
+    """Рисует маску 'L': 255 внутри круга, 0 снаружи"""
+    scale = SUPERSAMPLE if antialias else 1
+    canvas = size * scale
+
+    mask = Image.new('L', (canvas, canvas), 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse((0, 0, canvas - 1, canvas - 1), fill=255)
+
+    if antialias:
+        mask = mask.resize((size, size), Image.BOX)
+    return mask
+
+
+def get_circle_mask(size, antialias=MASK_ANTIALIAS):
+    """Возвращает закэшированную маску 'L' заданного размера"""
+    key = (size, antialias)
+    with _lock:
+        mask = _masks.get(key)
+        if mask is None:
+            mask = _render_mask(size, antialias)
+            _masks[key] = mask
+    return mask
+
+
+def get_overlay_path(size, antialias=MASK_ANTIALIAS):
+    """Возвращает путь к PNG-рамке для overlay.
+
+    Рамка - чёрное RGBA-изображение, прозрачное внутри круга.
+    Файл создаётся один раз и используется всеми процессами.
+    """
+    key = (size, antialias)
+    with _lock:
+        path = _paths.get(key)
+        if path is not None and os.path.exists(path):
+            return path
+
+        suffix = 'aa' if antialias else 'hard'
+        path = os.path.join(MASK_CACHE_DIR, f'circle_{size}_{suffix}.png')
+
+        if not os.path.exists(path):
+            os.makedirs(MASK_CACHE_DIR, exist_ok=True)
+
+            mask = _masks.get(key) or _render_mask(size, antialias)
+            _masks[key] = mask
+
+            frame = Image.new('RGBA', (size, size), (0, 0, 0, 255))
+            frame.putalpha(ImageOps.invert(mask))
+
+            # Пишем во временный файл и атомарно переименовываем,
+            # чтобы параллельные процессы не прочитали недописанный PNG
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            frame.save(tmp_path, format='PNG')
+            os.replace(tmp_path, path)
+            logger.info(f"Создана маска видеокружка {size}x{size}: {path}")
+
+        _paths[key] = path
+    return path
+
+
+def warm_up(sizes=MASK_SIZES, antialias=MASK_ANTIALIAS):
+    """Заранее создаёт маски для всех используемых размеров"""
+    for size in sizes:
+        get_overlay_path(size, antialias)
@@ -0,0 +1,248 @@
+"""
+Простые счётчики, датчики и гистограммы для мониторинга бота
+
+render() отдаёт все метрики в текстовом формате Prometheus
+(см. metrics_server).
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+REGISTRY = {}
+
+
+class Counter:
+    """Монотонно растущий счётчик"""
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+
+class Gauge:
+    """Текущее значение, которое может как расти, так и уменьшаться"""
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self):
+        return self._value
+
+
+# Границы корзин гистограмм времени, сек
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+class Histogram:
+    """Распределение значений по корзинам, отдельно для каждого набора меток"""
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # значения меток -> [счётчики корзин, сумма, количество]
+        self._lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет время выполнения блока"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    @property
+    def value(self):
+        """Количество и сумма наблюдений по наборам меток"""
+        with self._lock:
+            return {key: (series[2], series[1]) for key, series in self._series.items()}
+
+    def samples(self):
+        """Строки в формате Prometheus: корзины нарастающим итогом, сумма и количество"""
+        with self._lock:
+            series = {key: (list(buckets), total, count)
+                      for key, (buckets, total, count) in self._series.items()}
+        for key, (buckets, total, count) in sorted(series.items()):
+            labels = list(zip(self.labels, key))
+            for bound, bucket_count in zip(self.buckets, buckets):
+                yield f"{self.name}_bucket{_labels(labels + [('le', bound)])} {bucket_count}"
+            yield f"{self.name}_bucket{_labels(labels + [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{_labels(labels)} {total}"
+            yield f"{self.name}_count{_labels(labels)} {count}"
+
+
+def _labels(pairs):
+    """{name="value",...} с экранированием значений по правилам Prometheus"""
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def snapshot():
+    """Возвращает текущие значения всех метрик"""
+    return {name: metric.value for name, metric in REGISTRY.items()}
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for name, metric in REGISTRY.items():
+        if isinstance(metric, Histogram):
+            kind = 'histogram'
+        elif isinstance(metric, Gauge):
+            kind = 'gauge'
+        else:
+            kind = 'counter'
+        lines.append(f"# HELP {name} {metric.description}")
+        lines.append(f"# TYPE {name} {kind}")
+        if isinstance(metric, Histogram):
+            lines.extend(metric.samples())
+        else:
+            lines.append(f"{name} {metric.value}")
+    return '\n'.join(lines) + '\n'
+
+
+# Процессы ffmpeg, принудительно остановленные по таймауту или отмене
+ENCODER_KILLS = Counter(
+    'circle_encoder_kills_total',
+    'ffmpeg processes terminated on timeout or cancel'
+)
+
+# Процессы ffmpeg, не завершившиеся даже после SIGKILL
+ORPHANED_ENCODERS = Counter(
+    'circle_orphaned_encoders_total',
+    'ffmpeg processes that did not exit after SIGKILL'
+)
+
+# Успешно перекодированные видео
+TRANSCODES = Counter(
+    'circle_transcodes_total',
+    'successfully transcoded video notes'
+)
+
+# Суммарное время работы кодировщика
+ENCODE_SECONDS = Counter(
+    'circle_encode_seconds_total',
+    'wall time spent in ffmpeg for successful transcodes'
+)
+
+# Суммарный объём готовых видеокружков
+OUTPUT_BYTES = Counter(
+    'circle_output_bytes_total',
+    'bytes of produced video notes'
+)
+
+# Суммарная длительность готовых видеокружков
+OUTPUT_VIDEO_SECONDS = Counter(
+    'circle_output_video_seconds_total',
+    'seconds of produced video'
+)
+
+# Битрейт последнего готового видеокружка
+OUTPUT_BITRATE = Gauge(
+    'circle_output_bitrate_bps',
+    'average bitrate of the last produced video note'
+)
+
+# Очередь и занятые слоты TranscodeScheduler
+TRANSCODE_QUEUE_DEPTH = Gauge(
+    'circle_transcode_queue_depth',
+    'transcode jobs waiting for a free ffmpeg slot'
+)
+
+TRANSCODE_IN_FLIGHT = Gauge(
+    'circle_transcode_in_flight',
+    'ffmpeg processes currently running'
+)
+
+# Процессорное время ffmpeg (user + system) по rusage
+FFMPEG_CPU_SECONDS = Counter(
+    'circle_ffmpeg_cpu_seconds_total',
+    'CPU time (user + system) used by finished ffmpeg processes'
+)
+
+# Время этапов задачи по уровням качества: get_file, download, probe, queue,
+# ffmpeg, upload, status (ответ на обновление до начала обработки) и total
+STAGE_SECONDS = Histogram(
+    'circle_stage_seconds',
+    'time spent in each stage of a video note job',
+    labels=('quality', 'stage')
+)
+
+# Процессорное время ffmpeg на задачу по уровням качества
+JOB_CPU_SECONDS = Histogram(
+    'circle_job_cpu_seconds',
+    'ffmpeg CPU time per video note job',
+    labels=('quality',)
+)
+
+# Время обработчиков обновлений Telegram
+HANDLER_SECONDS = Histogram(
+    'circle_handler_seconds',
+    'time spent in Telegram update handlers',
+    labels=('handler',)
+)
+
+# Правки статусных сообщений (см. status_updates)
+STATUS_EDITS = Counter(
+    'circle_status_edits_total',
+    'status message edits and deletions sent to Telegram'
+)
+
+STATUS_COALESCED = Counter(
+    'circle_status_coalesced_total',
+    'status states dropped because a newer one replaced them'
+)
+
+STATUS_RETRY_AFTER = Counter(
+    'circle_status_retry_after_total',
+    'status edits rejected by Telegram flood control'
+)
@@ -0,0 +1,50 @@
+"""
+Локальный HTTP-сервер метрик
+
+Отдаёт GET /metrics в текстовом формате Prometheus. Слушает METRICS_HOST
+(по умолчанию только localhost) отдельно от webhook-сервера, чтобы метрики
+не были доступны снаружи. Бот и воркеры на одной машине должны получить
+разные METRICS_PORT: если порт занят, процесс работает без метрик.
+"""
+
+import logging
+
+from aiohttp import web
+
+from config import METRICS_HOST, METRICS_PORT
+from metrics import render
+
+logger = logging.getLogger(__name__)
+
+
+async def _handle_metrics(request):
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+def create_metrics_app():
+    web_app = web.Application()
+    web_app.router.add_get('/metrics', _handle_metrics)
+    return web_app
+
+
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Запускает сервер метрик; возвращает runner или None, если сервер не запущен"""
+    if not port:
+        return None
+
+    runner = web.AppRunner(create_metrics_app())
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logger.warning(f"Сервер метрик не запущен на {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+
+    logger.info(f"Метрики: http://{host}:{port}/metrics")
+    return runner
+
+
+async def stop_metrics_server(runner):
+    if runner is not None:
+        await runner.cleanup()
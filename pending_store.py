@@ -0,0 +1,162 @@
+"""
+Хранилище видео, ожидающих выбора качества
+
+Записи адресуются токеном из callback_data кнопок, поэтому у одного
+пользователя может быть несколько видео в ожидании. Записи живут
+PENDING_TTL секунд, их число ограничено PENDING_MAX_ENTRIES (старые
+вытесняются). Бэкенд 'sqlite' сохраняет ожидающие видео между перезапусками.
+"""
+
+import os
+import json
+import time
+import asyncio
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from config import (
+    PENDING_BACKEND, PENDING_STORE_PATH, PENDING_TTL, PENDING_MAX_ENTRIES
+)
+
+
+def new_token():
+    """Короткий токен: callback_data Telegram ограничена 64 байтами"""
+    return secrets.token_urlsafe(8)
+
+
+class MemoryPendingStore:
+    def __init__(self, ttl=PENDING_TTL, max_entries=PENDING_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        """Удаляет истёкшие записи (они упорядочены по времени добавления)"""
+        while self._items:
+            token, (expires_at, _) = next(iter(self._items.items()))
+            if expires_at > now:
+                break
+            del self._items[token]
+
+    async def add(self, entry):
+        """Сохраняет запись и возвращает её токен"""
+        token = new_token()
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            self._items[token] = (now + self.ttl, entry)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return token
+
+    async def get(self, token):
+        with self._lock:
+            item = self._items.get(token)
+        if item is None or item[0] <= time.time():
+            return None
+        return item[1]
+
+    async def pop(self, token):
+        """Забирает запись: повторное нажатие кнопки её уже не найдёт"""
+        with self._lock:
+            item = self._items.pop(token, None)
+        if item is None or item[0] <= time.time():
+            return None
+        return item[1]
+
+    def __len__(self):
+        with self._lock:
+            self._expire(time.time())
+            return len(self._items)
+
+
+class SqlitePendingStore:
+    def __init__(self, path=PENDING_STORE_PATH, ttl=PENDING_TTL,
+                 max_entries=PENDING_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            '''CREATE TABLE IF NOT EXISTS pending (
+                token TEXT PRIMARY KEY,
+                entry TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )'''
+        )
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS pending_expires_at ON pending (expires_at)'
+        )
+        self._db.commit()
+
+    def _add(self, entry):
+        token = new_token()
+        now = time.time()
+        with self._lock:
+            self._db.execute('DELETE FROM pending WHERE expires_at <= ?', (now,))
+            self._db.execute(
+                'INSERT INTO pending VALUES (?, ?, ?)',
+                (token, json.dumps(entry, separators=(',', ':')), now + self.ttl)
+            )
+            self._db.execute(
+                'DELETE FROM pending WHERE token IN ('
+                'SELECT token FROM pending ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            self._db.commit()
+        return token
+
+    def _get(self, token):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT entry FROM pending WHERE token = ? AND expires_at > ?',
+                (token, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _pop(self, token):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT entry, expires_at FROM pending WHERE token = ?', (token,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute('DELETE FROM pending WHERE token = ?', (token,))
+            self._db.commit()
+
+        entry, expires_at = row
+        return json.loads(entry) if expires_at > time.time() else None
+
+    async def add(self, entry):
+        """Сохраняет запись и возвращает её токен"""
+        return await asyncio.to_thread(self._add, entry)
+
+    async def get(self, token):
+        return await asyncio.to_thread(self._get, token)
+
+    async def pop(self, token):
+        """Забирает запись: повторное нажатие кнопки её уже не найдёт"""
+        return await asyncio.to_thread(self._pop, token)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM pending WHERE expires_at > ?', (time.time(),)
+            ).fetchone()[0]
+
+
+def create_pending_store(backend=PENDING_BACKEND):
+    """Создаёт хранилище по настройке PENDING_BACKEND: 'memory' или 'sqlite'"""
+    if backend == 'sqlite':
+        return SqlitePendingStore()
+    if backend == 'memory':
+        return MemoryPendingStore()
+    raise ValueError(f"Неизвестный бэкенд хранилища ожидающих видео: {backend}")
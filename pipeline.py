@@ -0,0 +1,29 @@
+"""
+Общие части графов ffmpeg для видеокружков
+
+Сами графы собираются этапами в circle_engine; здесь - круглая маска
+фильтрами ffmpeg и перепаковка готового файла.
+"""
+
+import ffmpeg
+
+from mask_cache import get_overlay_path
+
+
+def apply_circle_mask(video_stream, size):
+    """Накладывает готовую PNG-рамку из кэша масок поверх кадров.
+
+    Рамка - одно изображение: overlay повторяет его до конца видео.
+    """
+    mask = ffmpeg.input(get_overlay_path(size)).video
+    return ffmpeg.overlay(video_stream, mask).filter('format', 'yuv420p')
+
+
+def build_faststart_remux(input_path, output_path):
+    """Перепаковка без перекодирования в обычный MP4 с индексом в начале"""
+    return (
+        ffmpeg
+        .input(input_path)
+        .output(output_path, c='copy', movflags='faststart')
+        .overwrite_output()
+    )
@@ -0,0 +1,100 @@
+"""
+Отправка видеокружка одновременно с кодированием
+
+ffmpeg пишет фрагментированный MP4 (frag_keyframe+empty_moov) в stdout,
+а загрузка в Telegram начинается с первым фрагментом, поэтому общая
+задержка близка к max(кодирование, загрузка), а не к их сумме. Поток
+одновременно сохраняется в файл: он нужен для метрик и для запасного
+варианта, если Telegram не примет фрагментированный файл.
+"""
+
+import asyncio
+import logging
+
+from config import STREAM_CHUNK_SIZE, PIPELINED_UPLOAD_BUFFER
+
+logger = logging.getLogger(__name__)
+
+# Выход ffmpeg при потоковой отправке
+STREAM_OUTPUT = 'pipe:1'
+
+# Фрагментированный MP4 можно писать в канал: индекс не нужен в конце файла
+FRAGMENTED_MOVFLAGS = 'frag_keyframe+empty_moov+default_base_moof'
+
+
+class StreamAborted(Exception):
+    """ffmpeg не дописал поток: тело запроса нужно оборвать, а не завершать"""
+
+
+# Конец потока после ошибки ffmpeg
+_ABORTED = object()
+
+
+class StreamTee:
+    """Раздаёт stdout ffmpeg загрузке и одновременно пишет его в файл"""
+
+    def __init__(self, path, buffer_chunks=PIPELINED_UPLOAD_BUFFER):
+        self.path = path
+        self.started = asyncio.Event()
+        self._queue = asyncio.Queue(maxsize=buffer_chunks)
+        self._consumer_gone = False
+
+    async def feed(self, process):
+        """Читает stdout ffmpeg до конца; передаётся в submit как stdout_sink.
+
+        Обычный конец потока отправляется, только если ffmpeg завершился
+        с кодом 0. При ошибке, таймауте или отмене chunks() выбрасывает
+        StreamAborted, и Telegram не получит обрезанный файл как целый.
+        """
+        completed = False
+        try:
+            with open(self.path, 'wb') as f:
+                while True:
+                    chunk = await process.stdout.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    self.started.set()
+                    # Если загрузка оборвалась, ffmpeg всё равно дописывает файл
+                    if not self._consumer_gone:
+                        await self._queue.put(chunk)
+            completed = await process.wait() == 0
+        finally:
+            self.started.set()
+            if completed:
+                if not self._consumer_gone:
+                    await self._queue.put(None)
+            else:
+                self._abort()
+
+    def _abort(self):
+        """Заменяет непрочитанные фрагменты маркером ошибки, не дожидаясь места в очереди"""
+        self._drain()
+        if not self._consumer_gone:
+            self._queue.put_nowait(_ABORTED)
+
+    def _drain(self):
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def close(self):
+        """Загрузка больше не читает поток: feed перестаёт ждать место в очереди.
+
+        Вызывается снаружи генератора: если запрос упал до чтения тела,
+        chunks() так и не запустится и его finally не выполнится.
+        """
+        self._consumer_gone = True
+        self._drain()
+
+    async def chunks(self):
+        """Фрагменты для тела HTTP-запроса по мере их появления"""
+        try:
+            while True:
+                chunk = await self._queue.get()
+                if chunk is None:
+                    return
+                if chunk is _ABORTED:
+                    raise StreamAborted("ffmpeg завершился с ошибкой")
+                yield chunk
+        finally:
+            self.close()
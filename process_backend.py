@@ -0,0 +1,107 @@
+"""
+Бэкенд для CPU-ёмкой обработки кадров вне цикла событий
+
+Маскирование кадров в Python (OpenCV/NumPy) и синхронные вызовы ffmpeg
+выполняются в пуле процессов: цикл событий бота остаётся отзывчивым,
+а обработка нескольких видео распределяется по всем ядрам. Бэкенд
+'thread' оставлен для отладки и окружений, где нельзя порождать процессы.
+"""
+
+import asyncio
+import logging
+import weakref
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from config import FRAME_BACKEND, FRAME_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+def _mp_context():
+    """forkserver не наследует потоки и состояние цикла событий родителя"""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class ProcessBackend:
+    """Пул процессов, который пересоздаётся, если рабочий процесс упал"""
+
+    def __init__(self, max_workers=FRAME_WORKERS):
+        self.max_workers = max_workers
+        self._pool = self._create_pool()
+        # Пулы, остановленные из-за таймаута чужой задачи
+        self._stopped = weakref.WeakSet()
+
+    def _create_pool(self):
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_mp_context())
+
+    def _replace_pool(self, pool):
+        if self._pool is pool:
+            self._pool = self._create_pool()
+
+    def _kill_pool(self, pool):
+        """Убивает рабочие процессы пула: отдельный процесс ProcessPoolExecutor
+        не остановить, а гибель одного всё равно ломает весь пул"""
+        self._stopped.add(pool)
+        self._replace_pool(pool)
+        for process in list((pool._processes or {}).values()):
+            process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, func, *args, timeout=None):
+        """Выполняет func(*args) в рабочем процессе.
+
+        func и аргументы должны сериализоваться pickle: функция уровня
+        модуля, пути к файлам вместо кадров. По истечении timeout пул
+        убивается и выбрасывается asyncio.TimeoutError; задачи, которые
+        делили с ней пул, запускаются заново в новом.
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(pool, partial(func, *args)), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"{func.__name__} не уложилась в {timeout} сек, останавливаю рабочие процессы")
+            self._kill_pool(pool)
+            raise
+        except BrokenProcessPool:
+            if pool in self._stopped:
+                # Пул убит из-за таймаута другой задачи - эта ни в чём не виновата
+                return await self.run(func, *args, timeout=timeout)
+            # Рабочий процесс убит (например, OOM): задача потеряна, пул - нет
+            logger.error(f"Рабочий процесс пула упал во время {func.__name__}, пересоздаю пул")
+            self._replace_pool(pool)
+            pool.shutdown(wait=False)
+            return False
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ThreadBackend:
+    """Пул потоков: не блокирует цикл событий, но делит GIL с ботом"""
+
+    def __init__(self, max_workers=FRAME_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='frames')
+
+    async def run(self, func, *args, timeout=None):
+        """Поток по таймауту не остановить: задача дорабатывает, а ждать её перестают"""
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self._pool, partial(func, *args)), timeout
+        )
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def create_backend(kind=FRAME_BACKEND):
+    """Создаёт бэкенд по настройке FRAME_BACKEND: 'process' или 'thread'"""
+    if kind == 'process':
+        return ProcessBackend()
+    if kind == 'thread':
+        return ThreadBackend()
+    raise ValueError(f"Неизвестный бэкенд обработки кадров: {kind}")
@@ -0,0 +1,158 @@
+"""
+Кэш готовых видеокружков
+
+Хранит file_id уже отправленного видеокружка по ключу
+(file_unique_id исходного видео, качество, версия конвейера), чтобы
+повторный запрос того же ролика отправлялся без скачивания и кодирования.
+Данные лежат в SQLite и переживают перезапуск бота.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+
+from telegram.error import BadRequest
+
+from config import RESULT_CACHE_PATH, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    def __init__(self, path=RESULT_CACHE_PATH, max_entries=RESULT_CACHE_MAX_ENTRIES,
+                 ttl=RESULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            '''CREATE TABLE IF NOT EXISTS results (
+                file_unique_id TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                pipeline_version TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (file_unique_id, quality, pipeline_version)
+            )'''
+        )
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)'
+        )
+        self._db.commit()
+
+    def _get(self, file_unique_id, quality, pipeline_version):
+        if not file_unique_id:
+            return None
+
+        now = time.time()
+        key = (file_unique_id, quality, pipeline_version)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT file_id, created_at FROM results '
+                'WHERE file_unique_id = ? AND quality = ? AND pipeline_version = ?',
+                key
+            ).fetchone()
+            if row is None:
+                return None
+
+            file_id, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._db.execute(
+                    'DELETE FROM results '
+                    'WHERE file_unique_id = ? AND quality = ? AND pipeline_version = ?',
+                    key
+                )
+                self._db.commit()
+                return None
+
+            self._db.execute(
+                'UPDATE results SET last_used = ? '
+                'WHERE file_unique_id = ? AND quality = ? AND pipeline_version = ?',
+                (now, *key)
+            )
+            self._db.commit()
+        return file_id
+
+    def _put(self, file_unique_id, quality, pipeline_version, file_id):
+        if not file_unique_id or not file_id:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)',
+                (file_unique_id, quality, pipeline_version, file_id, now, now)
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _invalidate(self, file_unique_id, quality, pipeline_version):
+        with self._lock:
+            self._db.execute(
+                'DELETE FROM results '
+                'WHERE file_unique_id = ? AND quality = ? AND pipeline_version = ?',
+                (file_unique_id, quality, pipeline_version)
+            )
+            self._db.commit()
+
+    def _evict(self, now):
+        """Удаляет устаревшие записи и самые давно использованные сверх лимита"""
+        if self.ttl:
+            self._db.execute('DELETE FROM results WHERE created_at < ?', (now - self.ttl,))
+
+        if self.max_entries:
+            self._db.execute(
+                'DELETE FROM results WHERE rowid IN ('
+                'SELECT rowid FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    async def get(self, file_unique_id, quality, pipeline_version):
+        """Возвращает file_id готового кружка или None"""
+        return await asyncio.to_thread(self._get, file_unique_id, quality, pipeline_version)
+
+    async def put(self, file_unique_id, quality, pipeline_version, file_id):
+        """Запоминает file_id отправленного кружка и вытесняет лишние записи"""
+        await asyncio.to_thread(self._put, file_unique_id, quality, pipeline_version, file_id)
+
+    async def invalidate(self, file_unique_id, quality, pipeline_version):
+        """Удаляет запись, например если Telegram больше не принимает file_id"""
+        await asyncio.to_thread(self._invalidate, file_unique_id, quality, pipeline_version)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+async def send_cached_video_note(bot, cache, file_unique_id, quality, pipeline_version,
+                                 **send_kwargs):
+    """Пробует отправить готовый кружок из кэша по file_id.
+
+    Возвращает True, если отправка удалась. Недействительный file_id
+    удаляется из кэша, и вызывающий код выполняет обычную обработку.
+    """
+    file_id = await cache.get(file_unique_id, quality, pipeline_version)
+    if file_id is None:
+        return False
+
+    try:
+        await bot.send_video_note(video_note=file_id, **send_kwargs)
+        logger.info(f"Видеокружок {file_unique_id}/{quality} отправлен из кэша")
+        return True
+    except BadRequest as e:
+        logger.warning(f"Кэшированный file_id отклонён Telegram: {e}")
+        await cache.invalidate(file_unique_id, quality, pipeline_version)
+        return False
@@ -0,0 +1,249 @@
+"""
+Временные файлы задач
+
+Каждая задача получает свою директорию в SCRATCH_DIR, которая удаляется
+при выходе из `async with scratch_space.job(...)` - в том числе при
+исключении, таймауте и отмене. При запуске удаляются директории, оставшиеся
+от завершившихся процессов.
+
+Перед скачиванием задача резервирует место под вход и выход (выход
+оценивается по maxrate уровня качества, см. output_size_for). Если
+квота SCRATCH_QUOTA_MB занята, новые скачивания ждут, пока текущие
+задачи освободят диск. Квота диска считается в пределах одного процесса.
+
+Небольшие видео (до SCRATCH_RAM_MAX_INPUT_MB) получают директорию в tmpfs
+(SCRATCH_RAM_DIR, по умолчанию /dev/shm): скачивание, ffmpeg и отправка
+работают с памятью. tmpfs общий для бота и воркеров, поэтому квота памяти
+делится поровну между живыми процессами (метки proc-<pid>), а перед
+резервом проверяется реальное свободное место. Если памяти не хватает или
+видео крупнее порога, задача уходит на диск - ждать памяти она не будет.
+"""
+
+import os
+import time
+import uuid
+import shutil
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from config import (
+    SCRATCH_DIR, SCRATCH_QUOTA_MB, SCRATCH_OUTPUT_RESERVE_MB, SCRATCH_STALE_SECONDS,
+    SCRATCH_RAM_DIR, SCRATCH_RAM_QUOTA_MB, SCRATCH_RAM_MAX_INPUT_MB,
+    SCRATCH_RAM_OUTPUT_RESERVE_MB, CLEANUP_TEMP_FILES, MAX_FILE_SIZE_MB
+)
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Запас на контейнер MP4 и колебания битрейта вокруг maxrate
+OUTPUT_OVERHEAD = 1.1
+
+# Доля tmpfs, которую могут занять задачи
+RAM_SHARE = 0.8
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _kbps(rate):
+    """'1500k' -> 1500"""
+    return int(str(rate).lower().rstrip('k'))
+
+
+def output_size_for(settings, duration, copies=1):
+    """Оценка места под выход: maxrate видео и битрейт звука за duration секунд.
+
+    copies - сколько полных копий выхода может лежать одновременно
+    (перепаковка с faststart пишет вторую). None, если битрейт не ограничен.
+    """
+    if not settings.get('bitrate'):
+        return None
+    kbps = _kbps(settings['bitrate']) + _kbps(settings.get('audio_bitrate', '128k'))
+    return int(kbps * 1000 / 8 * duration * OUTPUT_OVERHEAD) * copies
+
+
+class JobDir:
+    """Директория одной задачи"""
+
+    def __init__(self, path, in_memory=False):
+        self.path = path
+        self.in_memory = in_memory
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+
+class ScratchSpace:
+    def __init__(self, root=SCRATCH_DIR, quota_bytes=SCRATCH_QUOTA_MB * MB,
+                 output_reserve=SCRATCH_OUTPUT_RESERVE_MB * MB,
+                 ram_root=SCRATCH_RAM_DIR, ram_quota_bytes=SCRATCH_RAM_QUOTA_MB * MB,
+                 ram_max_input=SCRATCH_RAM_MAX_INPUT_MB * MB,
+                 ram_output_reserve=SCRATCH_RAM_OUTPUT_RESERVE_MB * MB):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.output_reserve = output_reserve
+        self.reserved = 0
+        self._space_freed = asyncio.Condition()
+
+        self.ram_root = ram_root or None
+        self.ram_quota_bytes = ram_quota_bytes
+        self.ram_max_input = ram_max_input
+        self.ram_output_reserve = ram_output_reserve
+        self.ram_reserved = 0
+        self._ram_pid = None  # Процесс, для которого tmpfs уже проверен
+
+    def _setup_ram(self):
+        """Проверяет tmpfs, ограничивает квоту памяти его размером и отмечает процесс.
+
+        Вызывается из sweep() и при первой задаче процесса: не каждый процесс
+        (например, воркер) выполняет sweep().
+        """
+        if not self.ram_root or self._ram_pid == os.getpid():
+            return
+        self._ram_pid = os.getpid()
+        try:
+            os.makedirs(self.ram_root, exist_ok=True)
+            stat = os.statvfs(self.ram_root)
+            # По меткам процессы делят квоту между собой
+            open(os.path.join(self.ram_root, f'proc-{os.getpid()}'), 'w').close()
+        except OSError as e:
+            logger.warning(f"Директория в памяти {self.ram_root} недоступна, все задачи на диске: {e}")
+            self.ram_root = None
+            return
+        # В контейнерах /dev/shm часто всего 64 МБ
+        available = int(stat.f_blocks * stat.f_frsize * RAM_SHARE)
+        if available < self.ram_quota_bytes:
+            logger.info(f"Квота памяти под задачи уменьшена до {available // MB} МБ")
+            self.ram_quota_bytes = available
+
+    def _ram_processes(self):
+        """Сколько живых процессов делят tmpfs"""
+        try:
+            names = os.listdir(self.ram_root)
+        except OSError:
+            return 1
+        alive = sum(
+            1 for name in names
+            if name.startswith('proc-') and name[5:].isdigit() and _pid_alive(int(name[5:]))
+        )
+        return max(alive, 1)
+
+    def _ram_free(self):
+        """Свободное место в tmpfs сейчас (его могут занимать и другие процессы)"""
+        try:
+            stat = os.statvfs(self.ram_root)
+        except OSError:
+            return 0
+        return stat.f_bavail * stat.f_frsize
+
+    def sweep(self, max_age=SCRATCH_STALE_SECONDS):
+        """Удаляет директории задач умерших процессов и слишком старые.
+
+        Директория называется job-<pid>-<id>. Директории с нашим pid при
+        запуске остались от прошлого запуска (в контейнере pid часто совпадает).
+        """
+        os.makedirs(self.root, exist_ok=True)
+        self._setup_ram()
+        now = time.time()
+        removed = 0
+        roots = [self.root] + ([self.ram_root] if self.ram_root else [])
+        for root, name in ((root, name) for root in roots for name in os.listdir(root)):
+            path = os.path.join(root, name)
+            if name.startswith('proc-'):
+                # Метка умершего процесса больше не занимает долю квоты
+                pid = name[5:]
+                if pid.isdigit() and int(pid) != os.getpid() and not _pid_alive(int(pid)):
+                    os.unlink(path)
+                continue
+            if not name.startswith('job-') or not os.path.isdir(path):
+                continue
+            try:
+                pid = int(name.split('-')[1])
+            except (IndexError, ValueError):
+                pid = None
+            try:
+                age = now - os.path.getmtime(path)
+            except OSError:
+                continue
+            if pid is None or pid == os.getpid() or not _pid_alive(pid) or age > max_age:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info(f"Удалено {removed} забытых директорий задач")
+        return removed
+
+    def reservation_for(self, input_size, output_size=None):
+        """Сколько места зарезервировать под задачу с входом input_size байт"""
+        return (input_size or MAX_FILE_SIZE_MB * MB) + max(self.output_reserve, output_size or 0)
+
+    async def _reserve(self, nbytes):
+        async with self._space_freed:
+            # Задача больше квоты всё равно допускается, но только в одиночку
+            if self.reserved and self.reserved + nbytes > self.quota_bytes:
+                logger.info(f"Временная директория заполнена ({self.reserved // MB} МБ), "
+                            f"задача ждёт {nbytes // MB} МБ")
+            await self._space_freed.wait_for(
+                lambda: not self.reserved or self.reserved + nbytes <= self.quota_bytes
+            )
+            self.reserved += nbytes
+
+    async def _release(self, nbytes):
+        async with self._space_freed:
+            self.reserved -= nbytes
+            self._space_freed.notify_all()
+
+    def _reserve_ram(self, input_size, output_size=None):
+        """Резервирует память под небольшую задачу; 0 - задача пойдёт на диск"""
+        if not self.ram_root or not input_size or input_size > self.ram_max_input:
+            return 0
+        nbytes = input_size + (output_size or self.ram_output_reserve)
+        quota = self.ram_quota_bytes // self._ram_processes()
+        if self.ram_reserved + nbytes > quota or nbytes > self._ram_free():
+            return 0
+        self.ram_reserved += nbytes
+        return nbytes
+
+    @asynccontextmanager
+    async def job(self, input_size=None, output_size=None):
+        """Директория задачи: место резервируется до скачивания, удаляется всегда.
+
+        output_size - оценка места под выход (output_size_for), иначе резерв по умолчанию.
+        """
+        name = f'job-{os.getpid()}-{uuid.uuid4().hex[:12]}'
+        self._setup_ram()
+        ram_bytes = self._reserve_ram(input_size, output_size)
+        if ram_bytes:
+            path = os.path.join(self.ram_root, name)
+            try:
+                os.makedirs(path)
+                yield JobDir(path, in_memory=True)
+            finally:
+                if CLEANUP_TEMP_FILES:
+                    shutil.rmtree(path, ignore_errors=True)
+                self.ram_reserved -= ram_bytes
+            return
+
+        nbytes = self.reservation_for(input_size, output_size)
+        await self._reserve(nbytes)
+        path = os.path.join(self.root, name)
+        try:
+            os.makedirs(path)
+            yield JobDir(path)
+        finally:
+            if CLEANUP_TEMP_FILES:
+                shutil.rmtree(path, ignore_errors=True)
+            # Отмена не должна оставить резерв занятым
+            await asyncio.shield(self._release(nbytes))
+
+
+# Глобальный экземпляр
+scratch_space = ScratchSpace()
@@ -0,0 +1,156 @@
+"""
+Статусные сообщения задач без ожидания Telegram
+
+StatusMessage принимает новые состояния («Обрабатываю», «Создаю», прогресс
+кодирования, «Отправляю») мгновенно, а правит сообщение фоновая задача.
+Если за время ожидания пришло несколько состояний, отправляется только
+последнее - промежуточные устарели. Правки одного чата идут не чаще
+STATUS_CHAT_INTERVAL, всех чатов - не чаще STATUS_GLOBAL_RATE в секунду;
+на RetryAfter (429) задача ждёт указанное Telegram время и отправляет
+актуальное состояние. close() дожидается отправки последнего состояния.
+"""
+
+import time
+import asyncio
+import logging
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from config import (
+    STATUS_CHAT_INTERVAL, STATUS_GLOBAL_RATE, STATUS_GLOBAL_BURST, STATUS_CLOSE_TIMEOUT
+)
+from admission import TokenBucket
+from metrics import STATUS_EDITS, STATUS_COALESCED, STATUS_RETRY_AFTER
+
+logger = logging.getLogger(__name__)
+
+# Нет нового состояния (None - удалить сообщение)
+_NOTHING = object()
+
+# Сколько чатов помнить, прежде чем забыть тех, кому уже можно писать
+MAX_TRACKED_CHATS = 10000
+
+
+class StatusRateLimiter:
+    """Лимиты правок: интервал на чат и ведро токенов на бота"""
+
+    def __init__(self, chat_interval=STATUS_CHAT_INTERVAL, global_rate=STATUS_GLOBAL_RATE,
+                 global_burst=STATUS_GLOBAL_BURST):
+        self.chat_interval = chat_interval
+        self._global = TokenBucket(global_rate, global_burst)
+        self._next_allowed = {}  # chat_id -> время, с которого можно править
+
+    def delay(self, chat_id):
+        """Сколько секунд подождать перед правкой в этом чате"""
+        now = time.monotonic()
+        chat_wait = self._next_allowed.get(chat_id, 0.0) - now
+        return max(chat_wait, self._global.wait_time(1, now))
+
+    def acquire(self, chat_id):
+        """Отмечает правку, которую сейчас отправят"""
+        now = time.monotonic()
+        self._global.take(1)
+        self._next_allowed[chat_id] = now + self.chat_interval
+        if len(self._next_allowed) > MAX_TRACKED_CHATS:
+            self._next_allowed = {
+                chat: until for chat, until in self._next_allowed.items() if until > now
+            }
+
+    def backoff(self, chat_id, seconds):
+        """Telegram попросил подождать (RetryAfter)"""
+        until = time.monotonic() + seconds
+        self._next_allowed[chat_id] = max(self._next_allowed.get(chat_id, 0.0), until)
+
+
+# Общий для всех задач процесса
+status_limiter = StatusRateLimiter()
+
+
+class StatusMessage:
+    """Статусное сообщение задачи.
+
+    update(text) не ждёт Telegram; None удаляет сообщение. Объект можно
+    вызывать как корутину notify(text). Владелец обязан вызвать close().
+    """
+
+    def __init__(self, bot, chat_id, message_id, text=None, limiter=None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.limiter = limiter or status_limiter
+        self._shown = text         # Текст, который сейчас видит пользователь
+        self._pending = _NOTHING   # Последнее ещё не отправленное состояние
+        self._closed = False
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def update(self, text):
+        """Новое состояние; предыдущее неотправленное отбрасывается"""
+        if self._closed:
+            return
+        if self._pending is not _NOTHING:
+            STATUS_COALESCED.inc()
+        self._pending = text
+        self._wake.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def __call__(self, text):
+        self.update(text)
+
+    async def close(self, timeout=STATUS_CLOSE_TIMEOUT):
+        """Дожидается отправки последнего состояния (не дольше timeout)"""
+        self._closed = True
+        self._wake.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Статус в чате {self.chat_id} не отправлен за {timeout} сек")
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            if self._pending is _NOTHING:
+                if self._closed:
+                    return
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            delay = self.limiter.delay(self.chat_id)
+            if delay > 0:
+                # Пока ждём, состояние может смениться - отправится новое
+                await asyncio.sleep(delay)
+                continue
+
+            text = self._pending
+            self._pending = _NOTHING
+            await self._send(text)
+
+    async def _send(self, text):
+        if text is not None and text == self._shown:
+            return
+
+        self.limiter.acquire(self.chat_id)
+        try:
+            if text is None:
+                await self.bot.delete_message(self.chat_id, self.message_id)
+            else:
+                await self.bot.edit_message_text(
+                    text, chat_id=self.chat_id, message_id=self.message_id
+                )
+            STATUS_EDITS.inc()
+            self._shown = text
+        except RetryAfter as e:
+            STATUS_RETRY_AFTER.inc()
+            logger.info(f"Лимит правок в чате {self.chat_id}, жду {e.retry_after} сек")
+            self.limiter.backoff(self.chat_id, e.retry_after)
+            if self._pending is _NOTHING:
+                self._pending = text
+        except BadRequest as e:
+            # Например, сообщение уже удалено пользователем
+            logger.debug(f"Статус в чате {self.chat_id} не изменён: {e}")
+        except TelegramError as e:
+            logger.warning(f"Не удалось обновить статус в чате {self.chat_id}: {e}")
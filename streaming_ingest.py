@@ -0,0 +1,142 @@
+"""
+Потоковая передача скачиваемого видео прямо в stdin ffmpeg
+
+ffmpeg начинает декодировать, пока файл ещё скачивается. Если контейнер
+нельзя читать последовательно (MP4 с атомом moov в конце), поток
+сохраняется во временный файл и ffmpeg читает уже его.
+"""
+
+import logging
+
+import httpx
+
+from config import STREAM_CHUNK_SIZE, STREAM_SNIFF_LIMIT, TELEGRAM_PROXY_URL
+
+logger = logging.getLogger(__name__)
+
+# Вход ffmpeg при потоковом чтении
+STREAM_INPUT = 'pipe:0'
+
+# Результаты анализа начала файла
+STREAMABLE = 'streamable'
+NEEDS_SEEK = 'needs_seek'
+
+# Атомы верхнего уровня ISO BMFF (MP4/MOV), допустимые до moov
+_MP4_BOXES = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot', b'uuid'}
+
+
+def sniff_layout(head):
+    """Определяет по началу файла, можно ли читать его последовательно.
+
+    Возвращает STREAMABLE, NEEDS_SEEK или None, если данных пока мало.
+    """
+    if len(head) < 8:
+        return None
+
+    # Matroska/WebM, FLV и MPEG-TS читаются из канала без перемотки
+    if head[:4] == b'\x1a\x45\xdf\xa3' or head[:3] == b'FLV' or head[0] == 0x47:
+        return STREAMABLE
+
+    if head[4:8] not in _MP4_BOXES:
+        return NEEDS_SEEK
+
+    offset = 0
+    while offset + 8 <= len(head):
+        size = int.from_bytes(head[offset:offset + 4], 'big')
+        box = head[offset + 4:offset + 8]
+
+        if box == b'moov':
+            return STREAMABLE
+        if box in (b'mdat', b'moof'):
+            # Данные раньше индекса - ffmpeg придётся перематывать файл
+            return NEEDS_SEEK
+
+        if size == 1:
+            if offset + 16 > len(head):
+                return None
+            size = int.from_bytes(head[offset + 8:offset + 16], 'big')
+        elif size == 0:
+            # Атом до конца файла, а moov так и не встретился
+            return NEEDS_SEEK
+
+        if size < 8:
+            return NEEDS_SEEK
+        offset += size
+
+    return None
+
+
+class StreamingIngest:
+    """Источник входа для ffmpeg: канал при потоковом чтении или файл"""
+
+    def __init__(self, file, spill_path, chunk_size=STREAM_CHUNK_SIZE):
+        self.file = file
+        self.spill_path = spill_path
+        self.chunk_size = chunk_size
+        self.streaming = False
+        self._client = None
+        self._response = None
+        self._chunks = None
+        self._head = b''
+
+    async def open(self):
+        """Начинает скачивание и возвращает вход для ffmpeg: 'pipe:0' или путь"""
+        url = self.file.file_path
+
+        # Локальный Bot API сервер отдаёт путь к уже лежащему на диске файлу
+        if not url.startswith(('http://', 'https://')):
+            return url
+
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, read=60.0), proxies=TELEGRAM_PROXY_URL
+        )
+        request = self._client.build_request('GET', url)
+        self._response = await self._client.send(request, stream=True)
+        self._response.raise_for_status()
+        self._chunks = self._response.aiter_bytes(self.chunk_size)
+
+        head = bytearray()
+        layout = None
+        async for chunk in self._chunks:
+            head += chunk
+            layout = sniff_layout(head)
+            if layout is not None or len(head) >= STREAM_SNIFF_LIMIT:
+                break
+
+        if layout == STREAMABLE:
+            self.streaming = True
+            self._head = bytes(head)
+            return STREAM_INPUT
+
+        # moov в конце: докачиваем во временный файл
+        logger.info("Контейнер требует перемотки, скачиваю во временный файл")
+        try:
+            with open(self.spill_path, 'wb') as f:
+                f.write(head)
+                async for chunk in self._chunks:
+                    f.write(chunk)
+        finally:
+            await self.close()
+        return self.spill_path
+
+    async def chunks(self):
+        """Отдаёт оставшиеся байты потока для записи в stdin ffmpeg"""
+        if not self.streaming:
+            return
+
+        try:
+            yield self._head
+            self._head = b''
+            async for chunk in self._chunks:
+                yield chunk
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Закрывает HTTP-соединение"""
+        if self._response is not None:
+            await self._response.aclose()
+            self._response = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,82 @@
+"""Вёдра токенов и допуск видео"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('telegram')
+
+from admission import TokenBucket, AdmissionController
+
+
+def test_bucket_starts_full():
+    bucket = TokenBucket(rate=1, capacity=5)
+    assert bucket.wait_time(5, bucket.updated) == 0.0
+
+
+def test_bucket_wait_for_missing_tokens():
+    bucket = TokenBucket(rate=2, capacity=5)
+    now = bucket.updated
+    bucket.take(5)
+    assert bucket.wait_time(3, now) == pytest.approx(1.5)
+
+
+def test_bucket_refills_over_time():
+    bucket = TokenBucket(rate=2, capacity=5)
+    now = bucket.updated
+    bucket.take(5)
+    assert bucket.wait_time(3, now + 1.5) == 0.0
+    assert bucket.tokens == pytest.approx(3)
+
+
+def test_bucket_refill_capped_at_capacity():
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.take(1)
+    bucket.wait_time(1, bucket.updated + 100)
+    assert bucket.tokens == 5
+
+
+def test_wait_time_does_not_charge():
+    controller = AdmissionController(user_rate=0.01, user_burst=2,
+                                     global_rate=1, global_burst=100)
+    assert controller.wait_time(1, 2) == 0.0
+    assert controller.wait_time(1, 2) == 0.0
+
+
+def test_admit_charges_user_bucket():
+    controller = AdmissionController(user_rate=0.01, user_burst=2,
+                                     global_rate=1, global_burst=100)
+    assert controller.admit(1, 2) == 0.0
+    assert controller.admit(1, 1) > 0
+    # Другой пользователь не ждёт
+    assert controller.admit(2, 2) == 0.0
+
+
+def test_global_bucket_limits_all_users():
+    controller = AdmissionController(user_rate=1, user_burst=10,
+                                     global_rate=0.01, global_burst=3)
+    assert controller.admit(1, 2) == 0.0
+    assert controller.admit(2, 2) > 0
+
+
+def test_rejected_admit_takes_nothing():
+    controller = AdmissionController(user_rate=0.01, user_burst=10,
+                                     global_rate=0.01, global_burst=3)
+    assert controller.admit(1, 5) > 0
+    assert controller.admit(1, 3) == 0.0
+
+
+def test_charge_replies_on_reject():
+    controller = AdmissionController(user_rate=0.01, user_burst=1,
+                                     global_rate=1, global_burst=100)
+    replies = []
+
+    async def reply(text):
+        replies.append(text)
+
+    async def main():
+        assert await controller.charge(1, 1, reply)
+        assert not await controller.charge(1, 1, reply)
+
+    asyncio.run(main())
+    assert len(replies) == 1
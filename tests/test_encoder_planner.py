@@ -0,0 +1,68 @@
+"""Выбор пресета под бюджет и калибровка оценок"""
+
+import pytest
+
+from duration_limit import CLIP_LIMIT
+from encoder_planner import EncoderPlanner, PRESETS, STARTUP_COST
+
+SETTINGS = {'size': 384, 'crf': 23, 'preset': 'medium', 'bitrate': '1500k'}
+
+
+@pytest.fixture
+def planner():
+    return EncoderPlanner(cores=4, max_workers=2, smoothing=0.5)
+
+
+def test_without_budget_keeps_tier_settings(planner):
+    plan = planner.plan(SETTINGS, duration=10)
+    assert plan.preset == 'medium'
+    assert plan.rate_control == 'crf'
+    assert plan.output_args()['crf'] == 23
+
+
+def test_generous_budget_keeps_preset(planner):
+    plan = planner.plan(SETTINGS, duration=10, budget=1000)
+    assert plan.preset == 'medium'
+    assert plan.rate_control == 'crf'
+
+
+def test_tight_budget_downgrades_to_vbr(planner):
+    budget = planner.estimate('veryfast', 384, 10, threads=planner.threads_per_job())
+    plan = planner.plan(SETTINGS, duration=10, budget=budget)
+    assert PRESETS.index(plan.preset) <= PRESETS.index('veryfast')
+    assert plan.rate_control == 'vbr'
+    args = plan.output_args()
+    assert args['b:v'] == '1500k'
+    assert 'crf' not in args
+
+
+def test_impossible_budget_changes_only_preset(planner):
+    plan = planner.plan(SETTINGS, duration=10, budget=0.001)
+    assert plan.preset == 'ultrafast'
+    assert 'tune' not in plan.output_args()
+
+
+def test_queue_shrinks_budget(planner):
+    budget = planner.estimate('medium', 384, 10, threads=planner.threads_per_job(4))
+    assert planner.plan(SETTINGS, duration=10, budget=budget * 1.01).preset == 'medium'
+    assert planner.plan(SETTINGS, duration=10, budget=budget * 1.01,
+                        queue_depth=4).preset != 'medium'
+
+
+def test_estimate_capped_at_clip_limit(planner):
+    assert planner.estimate('fast', 384, CLIP_LIMIT * 10) == planner.estimate('fast', 384, CLIP_LIMIT)
+    assert planner.estimate('fast', 384, None) == planner.estimate('fast', 384, CLIP_LIMIT)
+
+
+def test_threads_split_between_workers(planner):
+    assert planner.threads_per_job(queue_depth=0, in_flight=0) == 4
+    assert planner.threads_per_job(queue_depth=3) == 2
+
+
+def test_record_moves_estimate_towards_actual(planner):
+    plan = planner.plan(SETTINGS, duration=10)
+    actual = STARTUP_COST + (plan.predicted_seconds - STARTUP_COST) * 2
+    planner.record(plan, actual)
+
+    recalibrated = planner.plan(SETTINGS, duration=10)
+    assert plan.predicted_seconds < recalibrated.predicted_seconds < actual
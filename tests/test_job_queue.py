@@ -0,0 +1,144 @@
+"""Очередь задач: порядок выдачи, возврат, аренды и попытки для обоих брокеров"""
+
+import asyncio
+
+import pytest
+
+from job_queue import SqliteBroker, RedisBroker
+
+
+def _sqlite(**kwargs):
+    return SqliteBroker(':memory:', **kwargs)
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def make_broker(request, monkeypatch):
+    """Брокер создаётся внутри asyncio.run: клиенту Redis нужен тот же цикл событий"""
+    if request.param == 'sqlite':
+        return _sqlite
+
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')  # Lua-скрипты в fakeredis
+    aioredis = pytest.importorskip('redis.asyncio')
+    monkeypatch.setattr(
+        aioredis, 'from_url', lambda url, **options: fakeredis.FakeAsyncRedis(**options)
+    )
+    return RedisBroker
+
+
+def run(scenario, make_broker, **kwargs):
+    async def main():
+        broker = make_broker(**kwargs)
+        try:
+            return await scenario(broker)
+        finally:
+            await broker.close()
+    return asyncio.run(main())
+
+
+def test_claim_in_enqueue_order(make_broker):
+    async def scenario(broker):
+        for n in range(3):
+            await broker.enqueue({'n': n})
+        assert await broker.depth() == 3
+        claimed = [(await broker.claim())['n'] for _ in range(3)]
+        assert claimed == [0, 1, 2]
+        assert await broker.claim() is None
+        assert await broker.depth() == 0
+
+    run(scenario, make_broker)
+
+
+def test_claim_counts_attempts(make_broker):
+    async def scenario(broker):
+        await broker.enqueue({'n': 0})
+        job = await broker.claim()
+        assert job['attempts'] == 1
+        assert job['n'] == 0
+        assert 'id' in job
+
+    run(scenario, make_broker)
+
+
+def test_failed_job_is_claimed_next(make_broker):
+    async def scenario(broker):
+        await broker.enqueue({'n': 0})
+        await broker.enqueue({'n': 1})
+        job = await broker.claim()
+        await broker.fail(job['id'])
+
+        retried = await broker.claim()
+        assert retried['n'] == 0
+        assert retried['attempts'] == 2
+        assert (await broker.claim())['n'] == 1
+
+    run(scenario, make_broker)
+
+
+def test_fail_without_retry_drops_job(make_broker):
+    async def scenario(broker):
+        await broker.enqueue({'n': 0})
+        job = await broker.claim()
+        await broker.fail(job['id'], retry=False)
+        assert await broker.claim() is None
+
+    run(scenario, make_broker)
+
+
+def test_fail_drops_job_after_max_attempts(make_broker):
+    async def scenario(broker):
+        await broker.enqueue({'n': 0})
+        for _ in range(2):
+            job = await broker.claim()
+            await broker.fail(job['id'])
+        assert job['attempts'] == 2
+        assert await broker.claim() is None
+
+    run(scenario, make_broker, max_attempts=2)
+
+
+def test_expired_lease_is_reclaimed(make_broker):
+    async def scenario(broker):
+        await broker.enqueue({'n': 0})
+        await broker.enqueue({'n': 1})
+        first = await broker.claim()
+        # Аренда уже истекла: воркер «упал», задача возвращается первой
+        again = await broker.claim()
+        assert again['id'] == first['id']
+        assert again['attempts'] == 2
+
+    run(scenario, make_broker, lease=-1)
+
+
+def test_expired_lease_dropped_after_max_attempts(make_broker):
+    async def scenario(broker):
+        await broker.enqueue({'n': 0})
+        assert (await broker.claim())['attempts'] == 1
+        assert (await broker.claim())['attempts'] == 2
+        assert await broker.claim() is None
+
+    run(scenario, make_broker, lease=-1, max_attempts=2)
+
+
+def test_renew_only_while_leased(make_broker):
+    async def scenario(broker):
+        await broker.enqueue({'n': 0})
+        job = await broker.claim()
+        assert await broker.renew(job['id'])
+
+        await broker.complete(job['id'])
+        assert not await broker.renew(job['id'])
+        assert await broker.claim() is None
+
+    run(scenario, make_broker)
+
+
+def test_fail_after_lost_lease_is_ignored(make_broker):
+    async def scenario(broker):
+        await broker.enqueue({'n': 0})
+        job = await broker.claim()
+        await broker.complete(job['id'])
+        await broker.fail(job['id'])
+        assert await broker.claim() is None
+
+    run(scenario, make_broker)
@@ -0,0 +1,58 @@
+"""Текстовый формат Prometheus"""
+
+import pytest
+
+import metrics
+from metrics import Counter, Gauge, Histogram, render
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    """Тестовые метрики не попадают в общий реестр бота"""
+    monkeypatch.setattr(metrics, 'REGISTRY', {})
+
+
+def test_counter_and_gauge():
+    counter = Counter('test_events_total', 'events')
+    gauge = Gauge('test_in_flight', 'jobs in flight')
+    counter.inc()
+    counter.inc(2)
+    gauge.inc(3)
+    gauge.dec()
+
+    assert render().splitlines() == [
+        '# HELP test_events_total events',
+        '# TYPE test_events_total counter',
+        'test_events_total 3',
+        '# HELP test_in_flight jobs in flight',
+        '# TYPE test_in_flight gauge',
+        'test_in_flight 2',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('test_seconds', 'latency', labels=('quality',), buckets=(1, 5))
+    histogram.observe(0.5, quality='hd')
+    histogram.observe(3, quality='hd')
+    histogram.observe(10, quality='hd')
+
+    lines = render().splitlines()
+    assert '# TYPE test_seconds histogram' in lines
+    assert lines[2:] == [
+        'test_seconds_bucket{quality="hd",le="1"} 1',
+        'test_seconds_bucket{quality="hd",le="5"} 2',
+        'test_seconds_bucket{quality="hd",le="+Inf"} 3',
+        'test_seconds_sum{quality="hd"} 13.5',
+        'test_seconds_count{quality="hd"} 3',
+    ]
+
+
+def test_label_values_are_escaped():
+    histogram = Histogram('test_seconds', 'latency', labels=('stage',), buckets=(1,))
+    histogram.observe(0.1, stage='a"b\\c\nd')
+    assert 'test_seconds_count{stage="a\\"b\\\\c\\nd"} 1' in render().splitlines()
+
+
+def test_render_ends_with_newline():
+    Counter('test_events_total', 'events')
+    assert render().endswith('\n')
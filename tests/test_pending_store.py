@@ -0,0 +1,66 @@
+"""Хранилища видео, ожидающих выбора качества"""
+
+import asyncio
+
+import pytest
+
+from pending_store import MemoryPendingStore, SqlitePendingStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request):
+    if request.param == 'sqlite':
+        return lambda **kwargs: SqlitePendingStore(':memory:', **kwargs)
+    return MemoryPendingStore
+
+
+def test_add_get_pop(make_store):
+    store = make_store(ttl=60, max_entries=10)
+
+    async def main():
+        token = await store.add({'file_id': 'a'})
+        assert await store.get(token) == {'file_id': 'a'}
+        # get не забирает запись, pop - забирает
+        assert await store.get(token) == {'file_id': 'a'}
+        assert await store.pop(token) == {'file_id': 'a'}
+        assert await store.pop(token) is None
+        assert await store.get(token) is None
+
+    asyncio.run(main())
+
+
+def test_tokens_are_unique(make_store):
+    store = make_store(ttl=60, max_entries=10)
+
+    async def main():
+        first = await store.add({'n': 1})
+        second = await store.add({'n': 2})
+        assert first != second
+        assert len(store) == 2
+
+    asyncio.run(main())
+
+
+def test_expired_entries_are_not_returned(make_store):
+    store = make_store(ttl=0, max_entries=10)
+
+    async def main():
+        token = await store.add({'n': 1})
+        assert await store.get(token) is None
+        assert await store.pop(token) is None
+        assert len(store) == 0
+
+    asyncio.run(main())
+
+
+def test_oldest_entries_are_evicted(make_store):
+    store = make_store(ttl=60, max_entries=2)
+
+    async def main():
+        tokens = [await store.add({'n': n}) for n in range(3)]
+        assert await store.get(tokens[0]) is None
+        assert await store.get(tokens[1]) == {'n': 1}
+        assert await store.get(tokens[2]) == {'n': 2}
+        assert len(store) == 2
+
+    asyncio.run(main())
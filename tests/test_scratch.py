@@ -0,0 +1,73 @@
+"""Оценка места под выход и директории задач"""
+
+import asyncio
+import os
+
+import pytest
+
+from scratch import ScratchSpace, output_size_for, OUTPUT_OVERHEAD, MB
+
+
+def test_output_size_from_bitrates():
+    settings = {'bitrate': '1000k', 'audio_bitrate': '128k'}
+    expected = int(1128 * 1000 / 8 * 10 * OUTPUT_OVERHEAD)
+    assert output_size_for(settings, 10) == expected
+    assert output_size_for(settings, 10, copies=2) == expected * 2
+
+
+def test_output_size_default_audio_bitrate():
+    assert output_size_for({'bitrate': '872k'}, 8) == int(1000 * 1000 / 8 * 8 * OUTPUT_OVERHEAD)
+
+
+def test_output_size_unlimited_bitrate():
+    assert output_size_for({'crf': 23}, 10) is None
+
+
+@pytest.fixture
+def space(tmp_path):
+    return ScratchSpace(
+        root=str(tmp_path / 'disk'), quota_bytes=100 * MB, output_reserve=4 * MB,
+        ram_root=str(tmp_path / 'ram'), ram_quota_bytes=50 * MB, ram_max_input=10 * MB
+    )
+
+
+def test_small_job_in_memory_without_sweep(space):
+    async def main():
+        async with space.job(input_size=MB, output_size=MB) as job:
+            assert job.in_memory
+            assert os.path.isdir(job.path)
+            assert space.ram_reserved == 2 * MB
+        assert not os.path.exists(job.path)
+        assert space.ram_reserved == 0
+
+    asyncio.run(main())
+    # Процесс отметился в tmpfs при первой задаче
+    assert f'proc-{os.getpid()}' in os.listdir(space.ram_root)
+
+
+def test_large_job_on_disk(space):
+    async def main():
+        async with space.job(input_size=20 * MB, output_size=MB) as job:
+            assert not job.in_memory
+            # Выход меньше резерва по умолчанию - резервируется не меньше него
+            assert space.reserved == 24 * MB
+        assert not os.path.exists(job.path)
+        assert space.reserved == 0
+
+    asyncio.run(main())
+
+
+def test_job_waits_for_disk_quota(space):
+    async def main():
+        order = []
+
+        async def job(name, hold):
+            async with space.job(input_size=60 * MB, output_size=MB):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        await asyncio.gather(job('first', 0.05), job('second', 0))
+        assert order == ['first', 'second']
+        assert space.reserved == 0
+
+    asyncio.run(main())
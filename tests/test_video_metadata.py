@@ -0,0 +1,84 @@
+"""Разбор заголовка MP4 без ffprobe"""
+
+import struct
+
+import pytest
+
+pytest.importorskip('ffmpeg')
+
+from video_metadata import parse_mp4_metadata
+
+IDENTITY = (0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+ROTATE_90 = (0, 0x10000, 0, -0x10000, 0, 0, 0, 0, 0x40000000)
+
+
+def box(kind, payload=b''):
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def mvhd(timescale, duration):
+    # version/flags, creation, modification, timescale, duration, остальное не читается
+    return box(b'mvhd', struct.pack('>IIIII', 0, 0, 0, timescale, duration) + bytes(80))
+
+
+def tkhd(width, height, matrix=IDENTITY):
+    header = struct.pack('>IIIIII', 0, 0, 0, 1, 0, 0) + bytes(16)
+    return box(b'tkhd', header + struct.pack('>9i', *matrix)
+               + struct.pack('>II', width << 16, height << 16))
+
+
+def trak(handler, width=0, height=0, matrix=IDENTITY):
+    hdlr = box(b'hdlr', bytes(8) + handler + bytes(12))
+    return box(b'trak', tkhd(width, height, matrix) + box(b'mdia', hdlr))
+
+
+def write_mp4(tmp_path, *traks, moov_first=True, duration=(1000, 12500)):
+    ftyp = box(b'ftyp', b'isom' + bytes(4))
+    moov = box(b'moov', mvhd(*duration) + b''.join(traks))
+    mdat = box(b'mdat', bytes(64))
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(ftyp + (moov + mdat if moov_first else mdat + moov))
+    return str(path)
+
+
+def test_video_and_audio(tmp_path):
+    path = write_mp4(tmp_path, trak(b'vide', 1280, 720), trak(b'soun'))
+    metadata = parse_mp4_metadata(path)
+    assert (metadata.width, metadata.height) == (1280, 720)
+    assert metadata.duration == pytest.approx(12.5)
+    assert metadata.has_audio is True
+    assert metadata.complete
+
+
+def test_without_audio(tmp_path):
+    metadata = parse_mp4_metadata(write_mp4(tmp_path, trak(b'vide', 640, 480)))
+    assert metadata.has_audio is False
+
+
+def test_moov_after_mdat(tmp_path):
+    path = write_mp4(tmp_path, trak(b'vide', 640, 480), moov_first=False)
+    assert parse_mp4_metadata(path).width == 640
+
+
+def test_rotation_swaps_dimensions(tmp_path):
+    path = write_mp4(tmp_path, trak(b'vide', 1920, 1080, ROTATE_90))
+    metadata = parse_mp4_metadata(path)
+    assert (metadata.width, metadata.height) == (1080, 1920)
+
+
+def test_no_video_track(tmp_path):
+    assert parse_mp4_metadata(write_mp4(tmp_path, trak(b'soun'))) is None
+
+
+def test_not_mp4(tmp_path):
+    path = tmp_path / 'video.webm'
+    path.write_bytes(b'\x1a\x45\xdf\xa3' + bytes(60))
+    assert parse_mp4_metadata(str(path)) is None
+
+
+def test_truncated_file(tmp_path):
+    path = write_mp4(tmp_path, trak(b'vide', 640, 480), moov_first=False)
+    data = open(path, 'rb').read()
+    with open(path, 'wb') as f:
+        f.write(data[:-20])
+    assert parse_mp4_metadata(path) is None
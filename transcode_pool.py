@@ -0,0 +1,353 @@
+"""
+Ограниченный пул перекодирования видео
+
+Одновременно выполняется не более TRANSCODE_WORKERS задач ffmpeg,
+остальные ждут в очереди FIFO и получают свою позицию в очереди.
+Каждая задача запускает ffmpeg как управляемый asyncio-подпроцесс,
+который принудительно завершается при таймауте или отмене.
+"""
+
+import asyncio
+import itertools
+import logging
+import re
+import resource
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+import ffmpeg
+
+from config import TRANSCODE_WORKERS, FFMPEG_TERM_GRACE, FFMPEG_KILL_GRACE
+from metrics import (
+    ENCODER_KILLS, ORPHANED_ENCODERS, FFMPEG_CPU_SECONDS, TRANSCODE_QUEUE_DEPTH, TRANSCODE_IN_FLIGHT
+)
+from transcode_result import inspect_output
+
+logger = logging.getLogger(__name__)
+
+
+class TranscodeJob:
+    """Задача перекодирования, владеющая своим процессом ffmpeg"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, func, args):
+        self.id = next(self._ids)
+        self.func = func
+        self.args = args
+        self.process = None
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.cpu_time = 0.0
+
+    def attach(self, process):
+        """Запоминает запущенный процесс ffmpeg этой задачи"""
+        self.process = process
+
+    @property
+    def wait_time(self):
+        """Время ожидания в очереди, сек"""
+        if self.started_at is None:
+            return time.monotonic() - self.enqueued_at
+        return self.started_at - self.enqueued_at
+
+
+class ChildCpuClock:
+    """Процессорное время завершённых дочерних процессов по rusage.
+
+    RUSAGE_CHILDREN копится на весь процесс, поэтому lap() сразу после
+    завершения ffmpeg отдаёт прирост с прошлого замера. Если несколько
+    дочерних процессов (в том числе ffprobe) завершились почти одновременно,
+    их время достанется первой задаче, сделавшей замер.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = self._total()
+
+    @staticmethod
+    def _total():
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+
+    def lap(self):
+        """Процессорное время, сек, с прошлого вызова"""
+        with self._lock:
+            total = self._total()
+            delta = total - self._last
+            self._last = total
+        FFMPEG_CPU_SECONDS.inc(delta)
+        return delta
+
+
+child_cpu_clock = ChildCpuClock()
+
+# Строка отчёта ffmpeg -progress: ключ=значение
+_PROGRESS_LINE = re.compile(rb'^[a-z0-9_]+=\S*$')
+
+
+def compile_command(stream_spec, progress=False):
+    """Превращает граф ffmpeg-python в список аргументов командной строки.
+
+    progress - ffmpeg пишет отчёт -progress в stderr вместе с ошибками.
+    """
+    cmd = ffmpeg.compile(stream_spec)
+    extra = ['-progress', 'pipe:2', '-nostats'] if progress else []
+    return [cmd[0], '-hide_banner', '-loglevel', 'error', *extra, *cmd[1:]]
+
+
+async def _read_stderr(process, on_progress=None):
+    """Читает stderr ffmpeg: отчёт -progress уходит в on_progress(секунды), остальное - ошибки"""
+    if on_progress is None:
+        return await process.stderr.read()
+
+    errors = []
+    async for line in process.stderr:
+        line = line.strip()
+        if not _PROGRESS_LINE.match(line):
+            errors.append(line)
+            continue
+        key, _, value = line.partition(b'=')
+        # out_time_ms, вопреки названию, тоже в микросекундах
+        if key in (b'out_time_us', b'out_time_ms') and value.isdigit():
+            on_progress(int(value) / 1_000_000)
+    return b'\n'.join(errors)
+
+
+async def _wait_exit(process, timeout):
+    """Ждёт завершения процесса; True, если процесс завершился.
+
+    process.wait() также ждёт закрытия каналов, поэтому при таймауте
+    дополнительно проверяется код возврата.
+    """
+    try:
+        await asyncio.wait_for(process.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+    return process.returncode is not None
+
+
+async def terminate_process(process, job_id=None):
+    """Останавливает ffmpeg: SIGTERM, затем SIGKILL, с ограничением по времени"""
+    if process is None or process.returncode is not None:
+        return
+
+    ENCODER_KILLS.inc()
+    try:
+        process.terminate()
+        if await _wait_exit(process, FFMPEG_TERM_GRACE):
+            return
+
+        logger.warning(f"ffmpeg задачи #{job_id} не завершился по SIGTERM, отправляю SIGKILL")
+        process.kill()
+        if await _wait_exit(process, FFMPEG_KILL_GRACE):
+            return
+    except ProcessLookupError:
+        return
+
+    ORPHANED_ENCODERS.inc()
+    logger.error(f"ffmpeg задачи #{job_id} (pid {process.pid}) не завершился после SIGKILL")
+
+
+class TranscodeScheduler:
+    def __init__(self, max_workers=TRANSCODE_WORKERS):
+        self.max_workers = max_workers
+        # Потоки нужны только для подготовки команды (ffprobe и т.п.)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='transcode'
+        )
+        self._waiting = deque()
+        self._active = 0
+
+    @property
+    def queue_depth(self):
+        """Количество задач, ожидающих свободного слота"""
+        return len(self._waiting)
+
+    @property
+    def in_flight(self):
+        """Количество выполняющихся задач"""
+        return self._active
+
+    def _update_gauges(self):
+        TRANSCODE_QUEUE_DEPTH.set(len(self._waiting))
+        TRANSCODE_IN_FLIGHT.set(self._active)
+
+    async def _acquire(self, job, on_queued):
+        """Занимает слот или ставит задачу в конец очереди"""
+        if self._active < self.max_workers and not self._waiting:
+            self._active += 1
+            self._update_gauges()
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.append(waiter)
+        self._update_gauges()
+        position = len(self._waiting)
+        logger.info(f"Задача #{job.id} в очереди, позиция {position}")
+
+        try:
+            if on_queued is not None:
+                try:
+                    await on_queued(position)
+                except Exception as e:
+                    logger.warning(f"Не удалось сообщить позицию в очереди: {e}")
+
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Слот уже передан этой задаче - возвращаем его
+                self._release()
+            else:
+                self._waiting.remove(waiter)
+                self._update_gauges()
+            raise
+
+    @asynccontextmanager
+    async def slot(self, on_queued=None):
+        """Слот пула для задачи, которая работает не через процесс ffmpeg
+        (профиль с маскированием кадров): тот же лимит и та же очередь"""
+        job = TranscodeJob(None, ())
+        await self._acquire(job, on_queued)
+        job.started_at = time.monotonic()
+        try:
+            yield job
+        finally:
+            self._release()
+
+    def _release(self):
+        """Передаёт слот первой ожидающей задаче или освобождает его"""
+        while self._waiting:
+            waiter = self._waiting.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self._active -= 1
+        self._update_gauges()
+
+    @staticmethod
+    async def _feed_stdin(process, chunks):
+        """Пишет поток байтов в stdin ffmpeg по мере поступления"""
+        if chunks is None:
+            return
+
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg закрыл вход раньше (например, достигнут лимит длительности)
+            pass
+        finally:
+            await chunks.aclose()
+            process.stdin.close()
+
+    @staticmethod
+    async def _drain_stdout(process, sink):
+        """Передаёт процесс ffmpeg потребителю stdout (например, потоковой загрузке)"""
+        if sink is not None:
+            await sink(process)
+
+    async def _run_process(self, job, cmd, timeout, stdin_chunks=None, stdout_sink=None,
+                           on_progress=None):
+        """Запускает ffmpeg и ждёт его завершения; при таймауте или отмене убивает"""
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if stdin_chunks is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE if stdout_sink is not None else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        job.attach(process)
+
+        try:
+            _, err, _, _ = await asyncio.wait_for(
+                asyncio.gather(
+                    self._feed_stdin(process, stdin_chunks),
+                    _read_stderr(process, on_progress),
+                    self._drain_stdout(process, stdout_sink),
+                    process.wait()
+                ),
+                timeout=timeout
+            )
+        except BaseException:
+            # Таймаут, отмена или ошибка скачивания в _feed_stdin - ffmpeg не должен остаться
+            await terminate_process(process, job.id)
+            job.cpu_time = child_cpu_clock.lap()
+            raise
+
+        job.cpu_time = child_cpu_clock.lap()
+        if process.returncode:
+            raise ffmpeg.Error('ffmpeg', None, err)
+
+    async def submit(self, build_command, *args, output_path, timeout=None, on_queued=None,
+                     ingest=None, stdout_sink=None, on_progress=None):
+        """Выполняет задачу, соблюдая лимит одновременных задач и очередь.
+
+        build_command(*args) выполняется в потоке и возвращает граф
+        ffmpeg-python или None, если подготовить команду не удалось.
+        Если задан ingest (StreamingIngest), скачивание начинается после
+        получения слота, а его вход ('pipe:0' или путь к файлу) передаётся
+        первым аргументом build_command; байты потока идут в stdin ffmpeg.
+        timeout отсчитывается с момента получения слота, время в очереди
+        не входит: он ограничивает и докачку во временный файл, когда
+        контейнер требует перемотки, и работу ffmpeg. По его истечении
+        ffmpeg завершается и выбрасывается asyncio.TimeoutError.
+        on_queued - корутина, получающая позицию, если задаче пришлось ждать.
+        stdout_sink - корутина, получающая процесс ffmpeg и читающая его
+        stdout (при выводе в 'pipe:1'); она должна сама записать output_path.
+        on_progress - функция, получающая закодированную длительность в
+        секундах по отчёту ffmpeg -progress.
+        Возвращает TranscodeResult с параметрами файла output_path (и
+        процессорным временем ffmpeg в cpu_time), если ffmpeg отработал
+        успешно, иначе None.
+        """
+        job = TranscodeJob(build_command, args)
+        await self._acquire(job, on_queued)
+
+        job.started_at = time.monotonic()
+        try:
+            stdin_chunks = None
+            if ingest is not None:
+                # Медленное скачивание не должно занимать слот бесконечно
+                args = (await asyncio.wait_for(ingest.open(), timeout), *args)
+                if ingest.streaming:
+                    stdin_chunks = ingest.chunks()
+                if timeout is not None:
+                    timeout = max(0.0, timeout - (time.monotonic() - job.started_at))
+
+            loop = asyncio.get_running_loop()
+            stream_spec = await loop.run_in_executor(
+                self._executor, partial(build_command, *args)
+            )
+            if stream_spec is None:
+                return None
+
+            started = time.monotonic()
+            await self._run_process(
+                job, compile_command(stream_spec, progress=on_progress is not None),
+                timeout, stdin_chunks, stdout_sink, on_progress
+            )
+            result = await loop.run_in_executor(
+                self._executor,
+                partial(inspect_output, output_path, time.monotonic() - started, job.wait_time)
+            )
+            if result:
+                result.cpu_time = job.cpu_time
+            return result
+
+        except ffmpeg.Error as e:
+            logger.error(f"Ошибка ffmpeg: {e.stderr.decode() if e.stderr else str(e)}")
+            return None
+        finally:
+            if ingest is not None:
+                await ingest.close()
+            self._release()
+
+    def shutdown(self):
+        """Останавливает пул потоков"""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,82 @@
+"""
+Результат перекодирования видеокружка
+
+Описывает готовый файл: реальную длительность, размеры, объём, время
+кодирования и битрейт. Эти данные передаются в send_video_note вместо
+фиксированных значений и учитываются в метриках.
+"""
+
+import os
+import logging
+
+from video_metadata import parse_mp4_metadata, probe_metadata
+from metrics import TRANSCODES, ENCODE_SECONDS, OUTPUT_BYTES, OUTPUT_VIDEO_SECONDS, OUTPUT_BITRATE
+
+logger = logging.getLogger(__name__)
+
+
+class TranscodeResult:
+    def __init__(self, output_path, size_bytes, duration, width, height, encode_time,
+                 queue_time=0.0):
+        self.output_path = output_path
+        self.size_bytes = size_bytes
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.encode_time = encode_time
+        self.queue_time = queue_time
+        self.cpu_time = 0.0  # Процессорное время ffmpeg, сек (заполняет TranscodeScheduler)
+        self.stages = {}  # Времена этапов обработки, сек (заполняет circle_engine)
+
+    @property
+    def bitrate(self):
+        """Средний битрейт файла, бит/с"""
+        if not self.duration:
+            return None
+        return self.size_bytes * 8 / self.duration
+
+    @property
+    def length(self):
+        """Диаметр видеокружка"""
+        return min(self.width, self.height)
+
+    def send_kwargs(self):
+        """Параметры send_video_note, описывающие файл"""
+        kwargs = {'length': self.length}
+        if self.duration:
+            kwargs['duration'] = max(1, round(self.duration))
+        return kwargs
+
+    def __repr__(self):
+        bitrate = f"{self.bitrate / 1000:.0f}kbps" if self.bitrate else "?"
+        return (f"TranscodeResult({self.width}x{self.height}, {self.duration}s, "
+                f"{self.size_bytes} bytes, {bitrate}, encode={self.encode_time:.1f}s)")
+
+
+def inspect_output(output_path, encode_time, queue_time=0.0):
+    """Собирает результат по готовому файлу; None, если файла нет или он пуст"""
+    if not os.path.exists(output_path):
+        return None
+    size_bytes = os.path.getsize(output_path)
+    if size_bytes == 0:
+        return None
+
+    # Файл записан с faststart: заголовок в начале, ffprobe обычно не нужен
+    metadata = parse_mp4_metadata(output_path)
+    if metadata is None:
+        metadata = probe_metadata(output_path)
+
+    result = TranscodeResult(
+        output_path, size_bytes, metadata.duration, metadata.width, metadata.height,
+        encode_time, queue_time
+    )
+
+    TRANSCODES.inc()
+    ENCODE_SECONDS.inc(encode_time)
+    OUTPUT_BYTES.inc(size_bytes)
+    if result.duration:
+        OUTPUT_VIDEO_SECONDS.inc(result.duration)
+        OUTPUT_BITRATE.set(result.bitrate)
+
+    logger.info(f"Перекодирование завершено: {result}")
+    return result
@@ -0,0 +1,226 @@
+"""
+Получение метаданных видео без отдельного процесса ffprobe
+
+Ширина, высота, длительность и наличие аудио берутся из кэша по
+file_unique_id, из заголовка MP4/MOV, который разбирается прямо в
+процессе, и из данных Telegram; один вызов ffprobe нужен только если
+этого не хватило.
+"""
+
+import logging
+import struct
+import threading
+from collections import OrderedDict
+
+import ffmpeg
+
+from config import METADATA_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Атом moov больше этого размера не разбираем в памяти
+MAX_MOOV_SIZE = 16 * 1024 * 1024
+
+
+class VideoMetadata:
+    def __init__(self, width=None, height=None, duration=None, has_audio=None):
+        self.width = width
+        self.height = height
+        self.duration = duration
+        self.has_audio = has_audio
+
+    @property
+    def complete(self):
+        """Известно всё, что нужно для построения графа ffmpeg"""
+        return None not in (self.width, self.height, self.has_audio)
+
+    def merge(self, other):
+        """Дополняет неизвестные поля значениями из other"""
+        if other is None:
+            return self
+        return VideoMetadata(
+            width=self.width if self.width is not None else other.width,
+            height=self.height if self.height is not None else other.height,
+            duration=self.duration if self.duration is not None else other.duration,
+            has_audio=self.has_audio if self.has_audio is not None else other.has_audio
+        )
+
+    @classmethod
+    def from_telegram(cls, media):
+        """Метаданные из объекта Video/Document Telegram (наличие аудио неизвестно)"""
+        return cls(
+            width=getattr(media, 'width', None) or None,
+            height=getattr(media, 'height', None) or None,
+            duration=getattr(media, 'duration', None) or None
+        )
+
+    def __repr__(self):
+        return (f"VideoMetadata({self.width}x{self.height}, "
+                f"duration={self.duration}, has_audio={self.has_audio})")
+
+
+def _iter_boxes(data, start, end):
+    """Перебирает атомы ISO BMFF внутри data[start:end]: (тип, начало, конец данных)"""
+    offset = start
+    while offset + 8 <= end:
+        size, box = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield box, offset + header, offset + size
+        offset += size
+
+
+def _parse_moov(moov):
+    """Разбирает содержимое атома moov"""
+    metadata = VideoMetadata(has_audio=False)
+
+    for box, start, end in _iter_boxes(moov, 0, len(moov)):
+        if box == b'mvhd':
+            version = moov[start]
+            if version == 1:
+                timescale, duration = struct.unpack_from('>IQ', moov, start + 20)
+            else:
+                timescale, duration = struct.unpack_from('>II', moov, start + 12)
+            if timescale:
+                metadata.duration = duration / timescale
+
+        elif box == b'trak':
+            handler = None
+            width = height = None
+            rotated = False
+
+            for sub, sub_start, sub_end in _iter_boxes(moov, start, end):
+                if sub == b'tkhd':
+                    version = moov[sub_start]
+                    matrix_offset = sub_start + (52 if version == 1 else 40)
+                    a, b = struct.unpack_from('>ii', moov, matrix_offset)
+                    width, height = struct.unpack_from('>II', moov, matrix_offset + 36)
+                    width >>= 16
+                    height >>= 16
+                    # Поворот на 90/270 градусов меняет местами ширину и высоту
+                    rotated = a == 0 and b != 0
+                elif sub == b'mdia':
+                    for mdia, mdia_start, _ in _iter_boxes(moov, sub_start, sub_end):
+                        if mdia == b'hdlr':
+                            handler = moov[mdia_start + 8:mdia_start + 12]
+
+            if handler == b'vide' and width and height and metadata.width is None:
+                if rotated:
+                    width, height = height, width
+                metadata.width = width
+                metadata.height = height
+            elif handler == b'soun':
+                metadata.has_audio = True
+
+    return metadata
+
+
+def parse_mp4_metadata(path):
+    """Читает метаданные из заголовка MP4/MOV; None для других контейнеров"""
+    try:
+        with open(path, 'rb') as f:
+            first = f.read(8)
+            if len(first) < 8 or first[4:8] not in (b'ftyp', b'moov', b'mdat', b'free', b'wide'):
+                return None
+
+            f.seek(0)
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                size, box = struct.unpack('>I4s', header)
+                header_size = 8
+                if size == 1:
+                    size = struct.unpack('>Q', f.read(8))[0]
+                    header_size = 16
+                elif size == 0:
+                    return None
+
+                if box == b'moov':
+                    if size > MAX_MOOV_SIZE:
+                        return None
+                    metadata = _parse_moov(f.read(size - header_size))
+                    return metadata if metadata.width else None
+
+                if size < header_size:
+                    return None
+                f.seek(size - header_size, 1)
+
+    except (OSError, struct.error, IndexError) as e:
+        logger.warning(f"Не удалось разобрать заголовок MP4: {e}")
+        return None
+
+
+def probe_metadata(path):
+    """Один вызов ffprobe на случай, если заголовок разобрать не удалось"""
+    probe = ffmpeg.probe(path)
+    video_info = next(s for s in probe['streams'] if s['codec_type'] == 'video')
+    duration = probe.get('format', {}).get('duration')
+    return VideoMetadata(
+        width=int(video_info['width']),
+        height=int(video_info['height']),
+        duration=float(duration) if duration else None,
+        has_audio=any(s['codec_type'] == 'audio' for s in probe['streams'])
+    )
+
+
+class MetadataCache:
+    """LRU-кэш метаданных по file_unique_id"""
+
+    def __init__(self, max_size=METADATA_CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_unique_id):
+        if not file_unique_id:
+            return None
+        with self._lock:
+            metadata = self._items.get(file_unique_id)
+            if metadata is not None:
+                self._items.move_to_end(file_unique_id)
+            return metadata
+
+    def put(self, file_unique_id, metadata):
+        if not file_unique_id or metadata is None:
+            return
+        with self._lock:
+            self._items[file_unique_id] = metadata
+            self._items.move_to_end(file_unique_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def prime(self, file_unique_id, media):
+        """Запоминает то, что сообщил Telegram, не затирая уже известное"""
+        hint = VideoMetadata.from_telegram(media)
+        cached = self.get(file_unique_id)
+        self.put(file_unique_id, cached.merge(hint) if cached else hint)
+
+
+metadata_cache = MetadataCache()
+
+
+def get_video_metadata(path, file_unique_id=None):
+    """Возвращает метаданные видео, запуская ffprobe только при необходимости.
+
+    Заголовок самого файла надёжнее данных Telegram, поэтому данные из
+    кэша используются лишь для полей, которые разобрать не удалось.
+    """
+    cached = metadata_cache.get(file_unique_id)
+    if cached is not None and cached.complete:
+        return cached
+
+    metadata = (parse_mp4_metadata(path) or VideoMetadata()).merge(cached)
+    if not metadata.complete:
+        metadata = probe_metadata(path).merge(metadata)
+
+    metadata_cache.put(file_unique_id, metadata)
+    return metadata
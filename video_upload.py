@@ -0,0 +1,150 @@
+"""
+Отправка видеокружка без лишних копий в памяти
+
+python-telegram-bot перед отправкой читает файл целиком в память и ещё
+раз копирует его в тело multipart-запроса. Здесь тело запроса собирается
+потоком: файл (или вывод ffmpeg) читается порциями по UPLOAD_CHUNK_SIZE
+и сразу уходит в сокет, так что в памяти находится не больше одной порции.
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+
+import httpx
+from telegram import Message
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+from config import ZERO_COPY_UPLOAD, UPLOAD_CHUNK_SIZE, TELEGRAM_PROXY_URL
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def _get_client():
+    """Общий HTTP-клиент для загрузок (пул соединений переиспользуется)"""
+    global _client
+    if _client is None:
+        # Тот же прокси, что и у запросов python-telegram-bot (см. webhook.build_application)
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=10.0), proxies=TELEGRAM_PROXY_URL
+        )
+    return _client
+
+
+async def close_upload_client():
+    """Закрывает HTTP-клиент загрузок; вызывается при остановке бота и воркера"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def file_chunks(path, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Читает файл порциями в потоке: на медленном или сетевом диске чтение не
+    должно останавливать цикл событий"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _multipart(fields, chunks, boundary, file_size=None):
+    """Тело multipart/form-data потоком и его длина (None, если размер файла неизвестен)"""
+    head = b''.join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    )
+    head += (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="video_note"; '
+        f'filename="circle.mp4"\r\nContent-Type: video/mp4\r\n\r\n'
+    ).encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+
+    async def body():
+        yield head
+        async for chunk in chunks:
+            yield chunk
+        yield tail
+
+    length = len(head) + file_size + len(tail) if file_size is not None else None
+    return body(), length
+
+
+def _raise_for_error(status, data):
+    """Превращает ответ Bot API с ошибкой в исключение python-telegram-bot"""
+    description = data.get('description', f'HTTP {status}')
+    retry_after = data.get('parameters', {}).get('retry_after')
+    if retry_after:
+        raise RetryAfter(retry_after)
+    if status == 400:
+        raise BadRequest(description)
+    if status == 403:
+        raise Forbidden(description)
+    if status >= 500:
+        raise NetworkError(description)
+    raise TelegramError(description)
+
+
+async def upload_video_note(bot, chunks, chat_id, duration=None, length=None,
+                            reply_to_message_id=None, file_size=None):
+    """Отправляет видеокружок из потока байтов и возвращает Message.
+
+    Если file_size известен, передаётся Content-Length, иначе тело
+    отправляется с chunked transfer encoding.
+    """
+    fields = {'chat_id': chat_id}
+    if duration is not None:
+        fields['duration'] = duration
+    if length is not None:
+        fields['length'] = length
+    if reply_to_message_id is not None:
+        fields['reply_to_message_id'] = reply_to_message_id
+
+    boundary = uuid.uuid4().hex
+    body, content_length = _multipart(fields, chunks, boundary, file_size)
+    headers = {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+    if content_length is not None:
+        headers['Content-Length'] = str(content_length)
+
+    try:
+        response = await _get_client().post(
+            f'{bot.base_url}/sendVideoNote', content=body, headers=headers
+        )
+    finally:
+        await chunks.aclose()
+
+    try:
+        data = response.json()
+    except ValueError:
+        # Например, HTML-страница 502/504 от прокси перед Bot API
+        data = {'description': f'HTTP {response.status_code}: {response.text[:200]}'}
+    if not data.get('ok'):
+        _raise_for_error(response.status_code, data)
+    return Message.de_json(data['result'], bot)
+
+
+async def send_video_note_file(bot, path, chat_id, duration=None, length=None,
+                               reply_to_message_id=None):
+    """Отправляет готовый файл видеокружка потоком (или через PTB, если отключено)"""
+    if not ZERO_COPY_UPLOAD:
+        with open(path, 'rb') as video_file:
+            return await bot.send_video_note(
+                chat_id=chat_id,
+                video_note=video_file,
+                duration=duration,
+                length=length,
+                reply_to_message_id=reply_to_message_id
+            )
+
+    return await upload_video_note(
+        bot, file_chunks(path), chat_id,
+        duration=duration,
+        length=length,
+        reply_to_message_id=reply_to_message_id,
+        file_size=os.path.getsize(path)
+    )
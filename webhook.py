@@ -0,0 +1,196 @@
+"""
+Приём обновлений Telegram: long polling или webhook на aiohttp
+
+В режиме webhook встроенный HTTP-сервер проверяет секретный токен,
+кладёт обновление в очередь приложения и сразу отвечает Telegram;
+обработка идёт отдельно. Несколько реплик могут стоять за балансировщиком.
+"""
+
+import asyncio
+import hmac
+import logging
+import secrets
+import signal
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor
+
+from metrics_server import start_metrics_server, stop_metrics_server
+from video_upload import close_upload_client
+from config import (
+    BOT_TOKEN, RUN_MODE, TELEGRAM_API_BASE_URL, TELEGRAM_FILE_BASE_URL, TELEGRAM_PROXY_URL,
+    CONCURRENT_UPDATES, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_SECRET, WEBHOOK_QUEUE_SIZE, WEBHOOK_MAX_CONNECTIONS
+)
+
+logger = logging.getLogger(__name__)
+
+# Боту нужны только сообщения и нажатия кнопок
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Обновления разных чатов обрабатываются параллельно, сообщения одного
+    чата - по порядку. Нажатия кнопок не ждут: повторные нажатия отсекает
+    сам бот, а задача, запущенная одной кнопкой, не задерживает другую."""
+
+    def __init__(self, max_concurrent_updates=CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self._chats = {}  # chat_id -> [Lock, число обновлений чата в обработке]
+
+    async def do_process_update(self, update, coroutine):
+        chat_id = None
+        if isinstance(update, Update) and update.message is not None:
+            chat_id = update.message.chat_id
+        if chat_id is None:
+            await coroutine
+            return
+
+        entry = self._chats.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat_id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+def build_application(mode=RUN_MODE):
+    """Создаёт Application с учётом режима приёма обновлений"""
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(ChatOrderedUpdateProcessor())
+    )
+
+    # Адрес API можно подменить, например на локальный тестовый сервер
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    if TELEGRAM_FILE_BASE_URL:
+        builder = builder.base_file_url(TELEGRAM_FILE_BASE_URL)
+    if TELEGRAM_PROXY_URL:
+        builder = builder.proxy_url(TELEGRAM_PROXY_URL).get_updates_proxy_url(TELEGRAM_PROXY_URL)
+
+    if mode == 'webhook':
+        # Обновления кладёт HTTP-сервер; ограниченная очередь даёт обратное давление
+        builder = builder.updater(None).update_queue(asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE))
+    else:
+        # run_polling вызывает эти хуки; в режиме webhook их вызывает serve_webhook
+        builder = builder.post_init(_start_metrics).post_shutdown(_shutdown)
+
+    return builder.build()
+
+
+async def _start_metrics(application):
+    application.bot_data['metrics_runner'] = await start_metrics_server()
+
+
+async def _shutdown(application):
+    await stop_metrics_server(application.bot_data.pop('metrics_runner', None))
+    await close_upload_client()
+
+
+async def _handle_update(request):
+    """Принимает обновление от Telegram и ставит его в очередь"""
+    application = request.app['application']
+
+    token = request.headers.get(SECRET_HEADER, '')
+    if not hmac.compare_digest(token, request.app['secret_token']):
+        return web.Response(status=403)
+
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+
+    update = Update.de_json(data, application.bot)
+    try:
+        application.update_queue.put_nowait(update)
+    except asyncio.QueueFull:
+        # Telegram повторит доставку позже
+        logger.warning("Очередь обновлений переполнена, отвечаю 503")
+        return web.Response(status=503)
+
+    return web.Response()
+
+
+async def _handle_health(request):
+    """Проверка живости для балансировщика"""
+    return web.Response(text='ok')
+
+
+def create_webhook_app(application, secret_token, path=WEBHOOK_PATH):
+    """Создаёт aiohttp-приложение для приёма webhook"""
+    web_app = web.Application()
+    web_app['application'] = application
+    web_app['secret_token'] = secret_token
+    web_app.router.add_post(path, _handle_update)
+    web_app.router.add_get('/healthz', _handle_health)
+    return web_app
+
+
+def _stop_on_signals():
+    """Событие, которое выставляется по SIGINT/SIGTERM"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    return stop_event
+
+
+async def serve_webhook(application, stop_event=None, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+    """Запускает HTTP-сервер и обработку обновлений до stop_event или сигнала"""
+    secret_token = WEBHOOK_SECRET
+    if not secret_token:
+        secret_token = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET не задан, сгенерирован случайный - "
+                       "при нескольких репликах задайте общий секрет")
+
+    runner = web.AppRunner(create_webhook_app(application, secret_token))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+
+    async with application:
+        await application.start()
+        await site.start()
+        await _start_metrics(application)
+        logger.info(f"Webhook-сервер слушает {host}:{port}{WEBHOOK_PATH}")
+
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                allowed_updates=ALLOWED_UPDATES,
+                secret_token=secret_token,
+                max_connections=WEBHOOK_MAX_CONNECTIONS
+            )
+
+        if stop_event is None:
+            stop_event = _stop_on_signals()
+        try:
+            await stop_event.wait()
+        finally:
+            await _shutdown(application)
+            await runner.cleanup()
+            await application.stop()
+
+
+def run_bot(application, mode=RUN_MODE):
+    """Запускает приём обновлений в выбранном режиме"""
+    if mode == 'webhook':
+        asyncio.run(serve_webhook(application))
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
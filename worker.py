@@ -0,0 +1,151 @@
+"""
+Воркер распределённой очереди видеокружков
+
+Забирает задачи из брокера (JOB_QUEUE=sqlite или redis), скачивает видео,
+кодирует его и отправляет кружок в чат. Фронтенд (bot_final.py с тем же
+JOB_QUEUE) только принимает обновления и ставит задачи в очередь.
+
+По SIGTERM/SIGINT воркер перестаёт брать новые задачи и дожидается
+текущих, поэтому узел можно вывести из работы без потери задач.
+"""
+
+import sys
+import asyncio
+import logging
+import signal
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from config import (
+    BOT_TOKEN, TELEGRAM_API_BASE_URL, TELEGRAM_FILE_BASE_URL, TELEGRAM_PROXY_URL,
+    WORKER_CONCURRENCY, WORKER_POLL_INTERVAL, JOB_LEASE_RENEW_INTERVAL,
+    validate_config, setup_temp_directory
+)
+from bot_final import create_bot as create_circle_bot
+from scratch import scratch_space
+from metrics_server import start_metrics_server, stop_metrics_server
+from status_updates import StatusMessage
+from video_upload import close_upload_client
+
+logger = logging.getLogger(__name__)
+
+
+def create_bot():
+    """Клиент Bot API с тем же адресом сервера, что и у фронтенда"""
+    kwargs = {}
+    if TELEGRAM_API_BASE_URL:
+        kwargs['base_url'] = TELEGRAM_API_BASE_URL
+    if TELEGRAM_FILE_BASE_URL:
+        kwargs['base_file_url'] = TELEGRAM_FILE_BASE_URL
+    if TELEGRAM_PROXY_URL:
+        kwargs['request'] = HTTPXRequest(proxy_url=TELEGRAM_PROXY_URL)
+    return Bot(BOT_TOKEN, **kwargs)
+
+
+async def keep_lease(broker, job_id, interval=JOB_LEASE_RENEW_INTERVAL):
+    """Продлевает аренду, пока задача выполняется: ожидание места, очередь
+    кодирования и загрузка могут занять больше JOB_LEASE_SECONDS"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not await broker.renew(job_id):
+                logger.warning(f"Аренда задачи #{job_id} уже истекла")
+                return
+        except Exception as e:
+            logger.warning(f"Не удалось продлить аренду задачи #{job_id}: {e}")
+
+
+async def run_job(circle_bot, broker, bot, job):
+    """Выполняет одну задачу и подтверждает её в брокере"""
+    # Статус показывается в сообщении с кнопками, которое оставил фронтенд
+    status = StatusMessage(bot, job['chat_id'], job['status_message_id'])
+    lease = asyncio.create_task(keep_lease(broker, job['id']))
+
+    logger.info(f"Задача #{job['id']} (попытка {job['attempts']}): "
+                f"{job['file_unique_id']}/{job['quality']}")
+    try:
+        await circle_bot.process_circle_job(bot, job, status)
+    except asyncio.CancelledError:
+        # Воркер останавливают посреди задачи - её выполнит другой воркер
+        await broker.fail(job['id'], retry=True)
+        raise
+    finally:
+        lease.cancel()
+        await status.close()
+
+    # Ошибку обработки пользователь уже увидел, повторять задачу не нужно
+    await broker.complete(job['id'])
+
+
+async def run_worker(circle_bot, broker, bot, stop_event, concurrency=WORKER_CONCURRENCY):
+    """Забирает задачи, пока не выставлен stop_event, затем дожидается текущих"""
+    slots = asyncio.Semaphore(concurrency)
+    in_flight = set()
+
+    while not stop_event.is_set():
+        await slots.acquire()
+        job = None
+        try:
+            if not stop_event.is_set():
+                job = await broker.claim()
+        finally:
+            if job is None:
+                slots.release()
+
+        if job is None:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=WORKER_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        task = asyncio.create_task(run_job(circle_bot, broker, bot, job))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        task.add_done_callback(lambda _: slots.release())
+
+    if in_flight:
+        logger.info(f"Остановка: жду завершения {len(in_flight)} задач")
+        await asyncio.gather(*in_flight, return_exceptions=True)
+
+
+async def main_async():
+    """Работает до сигнала остановки; возвращает код завершения процесса"""
+    circle_bot = create_circle_bot()
+    broker = circle_bot.job_broker
+    if broker is None:
+        logger.error("Воркеру нужна очередь: задайте JOB_QUEUE=sqlite или JOB_QUEUE=redis")
+        return 1
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    metrics_runner = await start_metrics_server()
+    async with create_bot() as bot:
+        logger.info("Воркер запущен")
+        try:
+            await run_worker(circle_bot, broker, bot, stop_event)
+        finally:
+            await stop_metrics_server(metrics_runner)
+            await close_upload_client()
+            await broker.close()
+            circle_bot.engine.shutdown()
+    logger.info("Воркер остановлен")
+    return 0
+
+
+def main():
+    """Запуск воркера"""
+    if not validate_config():
+        sys.exit(1)
+
+    setup_temp_directory()
+    scratch_space.sweep()
+    sys.exit(asyncio.run(main_async()))
+
+
+if __name__ == '__main__':
+    main()